@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+import argparse
+from datetime import datetime, timezone
+from glob import glob
+import json
+import os
+from os import path
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), '../src/msbdata')))
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), '../src/plot_csv')))
+
+from gen_msblog import gen_msblogs, DEFAULT_RATES
+from msbdata import read_parse_msblogfile, read_parse_msblogfile_columnar, decompose_logfile_stream
+from extract_msbdata import extract_logfile
+from aggregate_msbdata import aggregate_msbdata
+from csv_io import read_csv_files
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H-%M-%S"
+
+
+def parse_cmdline() -> dict:
+    cmd_parser = argparse.ArgumentParser(
+        description="measure the throughput of the msb data processing pipeline on synthetic logfiles"
+    )
+    cmd_parser.add_argument('--size', default=16.0, type=float, help='size of a single synthetic logfile in MB. Default: 16')
+    cmd_parser.add_argument('--files', default=4, type=int, help='number of synthetic logfiles. Default: 4')
+    cmd_parser.add_argument('--repeat', default=3, type=int, help='number of runs per benchmark, the fastest run is reported. Default: 3')
+    cmd_parser.add_argument('--malformed', default=0.001, type=float, help='fraction of malformed lines. Default: 0.001')
+    cmd_parser.add_argument('--seed', default=0, type=int)
+    cmd_parser.add_argument('--work-dir', default=None, type=str, help='directory for the synthetic logfiles and outputs. Default: a temporary directory')
+    cmd_parser.add_argument('-o', '--output', default=None, type=str, help='json file the results are written to. Default: bench_<git revision>.json')
+    cmd_parser.add_argument('--compare', default=None, type=str, help='json file of a previous run to compare the results against')
+    cmd_parser.add_argument('--verbose', action='store_true')
+    return cmd_parser.parse_args().__dict__
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=path.dirname(path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def count_lines(files: list) -> int:
+    lines = 0
+    for f in files:
+        with open(f, 'rb') as fhandle:
+            lines += sum(block.count(b'\n') for block in iter(lambda: fhandle.read(1 << 20), b''))
+    return lines
+
+
+def measure(name: str, func, files: list, repeat: int, verbose: bool = False) -> dict:
+    """
+    measure(name : str, func, files : list, repeat : int, verbose : bool = False) -> dict
+
+    runs func() repeat times and reports the throughput of the fastest run
+    relative to the number of lines and bytes in the input files
+
+        Returns:
+            dict containing seconds, lines, bytes, lines_per_s and mb_per_s
+    """
+    timings = list()
+    for _ in range(repeat):
+        t_start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - t_start)
+    seconds = min(timings)
+    n_lines = count_lines(files)
+    n_bytes = sum(path.getsize(f) for f in files)
+    result = {
+        'seconds': seconds,
+        'lines': n_lines,
+        'bytes': n_bytes,
+        'lines_per_s': n_lines / seconds,
+        'mb_per_s': n_bytes / seconds / 1024 / 1024,
+    }
+    if verbose:
+        print(f"{name}: {seconds:.3f} s, {result['lines_per_s']:.0f} lines/s, {result['mb_per_s']:.2f} MB/s")
+    return result
+
+
+def bench_extract(logfiles: list, output_dir: str):
+    """the default csv extraction of extract_msbdata"""
+    for logfile in logfiles:
+        extract_logfile(logfile, {'output_dir': output_dir, 'verbose': False})
+
+
+def bench_extract_json(logfiles: list, output_dir: str):
+    """csv extraction decoding every line with json, as in --incremental mode"""
+    for logfile in logfiles:
+        decompose_logfile_stream(
+            read_parse_msblogfile(logfile),
+            path.basename(logfile).split('.')[0],
+            output_dir=output_dir,
+        )
+
+
+def bench_decode_json(logfiles: list):
+    for logfile in logfiles:
+        for _ in read_parse_msblogfile(logfile):
+            pass
+
+
+def bench_decode_columnar(logfiles: list):
+    for logfile in logfiles:
+        read_parse_msblogfile_columnar(logfile)
+
+
+def bench_aggregate(input_files: list, output_dir: str):
+    for f in glob(path.join(output_dir, '*')):
+        os.remove(f)
+    aggregate_msbdata({
+        'input': input_files,
+        'output': output_dir,
+        'output_prefix': 'aggregated',
+        'interval': 'daily',
+        'timestamp_format': TIMESTAMP_FORMAT,
+        'format': 'csv',
+        'compress': None,
+        'verbose': False,
+    })
+
+
+def run_benchmarks(config: dict, work_dir: str) -> dict:
+    log_dir = path.join(work_dir, 'logs')
+    extract_dir = path.join(work_dir, 'extracted')
+    aggregate_dir = path.join(work_dir, 'aggregated')
+    for d in (log_dir, extract_dir, aggregate_dir):
+        os.makedirs(d, exist_ok=True)
+
+    logfiles = gen_msblogs({
+        'output_dir': log_dir,
+        'msb': 'msb-0001-a',
+        'begin': '2022-02-06T00:00:00+00:00',
+        'duration': None,
+        'files': config['files'],
+        'size': config['size'],
+        'imu_rate': DEFAULT_RATES['imu'],
+        'att_rate': DEFAULT_RATES['att'],
+        'gps_rate': DEFAULT_RATES['gps'],
+        'malformed': config['malformed'],
+        'gaps': 0.001,
+        'gap_duration': 10.0,
+        'no_fix': 0.05,
+        'seed': config['seed'],
+        'timestamp_format': TIMESTAMP_FORMAT,
+        'verbose': config['verbose'],
+    })
+
+    results = dict()
+    results['decode_json'] = measure(
+        'decode_json', lambda: bench_decode_json(logfiles), logfiles, config['repeat'], config['verbose']
+    )
+    results['decode_columnar'] = measure(
+        'decode_columnar', lambda: bench_decode_columnar(logfiles), logfiles, config['repeat'], config['verbose']
+    )
+
+    def extract(bench):
+        for f in glob(path.join(extract_dir, '*', '*')):
+            os.remove(f)
+        bench(logfiles, extract_dir)
+
+    results['extract_json'] = measure(
+        'extract_json', lambda: extract(bench_extract_json), logfiles, config['repeat'], config['verbose']
+    )
+    results['extract'] = measure('extract', lambda: extract(bench_extract), logfiles, config['repeat'], config['verbose'])
+
+    imu_files = sorted(glob(path.join(extract_dir, 'imu', '*.csv')))
+    results['aggregate'] = measure(
+        'aggregate', lambda: bench_aggregate(imu_files, aggregate_dir), imu_files, config['repeat'], config['verbose']
+    )
+    results['read_csv_files'] = measure(
+        'read_csv_files', lambda: read_csv_files(imu_files), imu_files, config['repeat'], config['verbose']
+    )
+    return results
+
+
+def compare_results(results: dict, reference: dict):
+    print(f"{'benchmark':<16} {'MB/s':>10} {'reference':>10} {'ratio':>8}")
+    for name, result in results.items():
+        if name not in reference:
+            continue
+        ratio = result['mb_per_s'] / reference[name]['mb_per_s']
+        print(f"{name:<16} {result['mb_per_s']:>10.2f} {reference[name]['mb_per_s']:>10.2f} {ratio:>8.2f}")
+
+
+if __name__ == "__main__":
+    config = parse_cmdline()
+    if config['work_dir']:
+        os.makedirs(config['work_dir'], exist_ok=True)
+        results = run_benchmarks(config, config['work_dir'])
+    else:
+        with tempfile.TemporaryDirectory() as work_dir:
+            results = run_benchmarks(config, work_dir)
+
+    revision = git_revision()
+    report = {
+        'revision': revision,
+        'date': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'parameters': {key: config[key] for key in ('size', 'files', 'repeat', 'malformed', 'seed')},
+        'results': results,
+    }
+    output = config['output'] or f'bench_{revision}.json'
+    with open(output, 'w') as fhandle:
+        json.dump(report, fhandle, indent=1)
+    print(f'results written to {output}')
+
+    if config['compare']:
+        with open(config['compare'], 'r') as fhandle:
+            compare_results(results, json.load(fhandle)['results'])
@@ -4,9 +4,9 @@ from os import path
 import sys
 import time
 
-sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), '../src')))
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), '../src/msbdata')))
 
-from SAAFOWE.io.timefiles import find_time_files
+from msbcatalog import find_time_files
 
 
 def parse_cmdline() -> dict:
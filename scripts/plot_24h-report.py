@@ -11,6 +11,15 @@ import sys
 import pandas as pd
 import time
 
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), '../src/msbdata')))
+
+from msbcatalog import select_catalog_files
+from msbformats import read_data_file
+from msbtimes import select_time_window
+
+DATA_FILE_EXTENSIONS = ("csv", "parquet", "feather", "npz")
+COMPRESSION_EXTENSIONS = ("gz", "xz", "zst")
+
 
 def parse_arguments() -> dict:
     arg_parser = argparse.ArgumentParser()
@@ -45,25 +54,40 @@ def parse_arguments() -> dict:
 
 def find_time_files(
     file_dir: str,
-    file_pattern: str = "*.csv",
+    file_pattern: str = "*",
     begin: datetime = datetime.fromisoformat("1970-01-01T00:00:00+00:00"),
     end: datetime = datetime.fromtimestamp(time.time(), timezone.utc),
+    extensions: tuple = DATA_FILE_EXTENSIONS,
     verbose=False,
 ) -> list:
 
-    files = list()
+    candidates = list()
 
-    for file in sorted(glob(path.join(file_dir, file_pattern))):
-        timestamp = datetime.fromisoformat(file.split("_")[-1].split(".")[0])
+    def has_extension(file):
+        extension = file.split(".")[-1]
+        if extension in COMPRESSION_EXTENSIONS:
+            extension = file.split(".")[-2]
+        return extension in extensions
+
+    # a file catalog answers with a single indexed query, see msbcatalog
+    if (cataloged := select_catalog_files(file_dir, begin.timestamp(), end.timestamp(), file_pattern)) is not None:
         if verbose:
-            print(f"timestamp: {timestamp}")
-        if begin <= timestamp <= end:
-            if verbose:
-                print(f"matching file: {file}")
-            files.append(file)
+            print(f"selected {len(cataloged)} files from the catalog")
+        return [file for file in cataloged if has_extension(file)]
+
+    for file in sorted(glob(path.join(file_dir, file_pattern))):
+        if not has_extension(file):
             continue
-        if verbose:
-            print(f"skipping: {file}")
+        candidates.append(file)
+
+    # bisects the files on the time stamps written by aggregate_msbdata and
+    # includes the file before begin, which may hold data from the window
+    files = select_time_window(
+        candidates, begin.timestamp(), end.timestamp(), "%Y-%m-%dT%H:%M:%S%z"
+    )
+    if verbose:
+        for file in files:
+            print(f"matching file: {file}")
 
     return files
 
@@ -92,7 +116,7 @@ def read_data(files: list, verbose=False) -> pd.DataFrame:
 
     for file in files:
 
-        tmp = pd.read_csv(file)
+        tmp = read_data_file(file)
 
         try:
             set_index(tmp)
@@ -219,7 +243,8 @@ def get_msb_dataset(
     if verbose: print(f'found {len(files)} data files')
 
     data = read_data(files, verbose=verbose)
-    data.sort_index(inplace=True)
+    if not data.index.is_monotonic_increasing:
+        data.sort_index(inplace=True)
 
     return data
 
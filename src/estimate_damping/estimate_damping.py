@@ -1,14 +1,18 @@
 import json
 import matplotlib.pyplot as plt
 import numpy as np
+from os import path
 import pandas as pd
 import sys
 
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), "../msbdata")))
+
 from cmdline import parse_cmdline
 from bfilter import butter_lowpass_sosfiltfilt
 from plot import plot_signal
 from rdm import rdm
 from testdata import damped_harmonic_signal
+from msbformats import read_data_file
 
 # TODO
 # - implement low pass filtering
@@ -47,7 +51,7 @@ def estimate_damping(args: dict):
     for filepath in gen_input_files(args):
         if args["verbose"]:
             print(f"processing {filepath}")
-        data = pd.read_csv(filepath)
+        data = read_data_file(filepath)
         data.epoch = pd.to_datetime(data.epoch, utc=True, unit="s")
         data.set_index("epoch", inplace=True)
         for component in ["x", "y", "z"]:
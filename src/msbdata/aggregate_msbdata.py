@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import date, datetime, timezone, timedelta
+import numpy as np
 import os
 import sys
 
@@ -10,8 +12,22 @@ from msbdata import (
     extract_timestamp_fpaths,
     validate_fpaths,
     concat_files,
+    concat_data_files,
+    merge_files,
 )
-from msbtimes import are_in_equivalent_datetime_interval, AGGREGATION_INTERVALS
+from msbcatalog import update_catalog, has_catalog
+from msbformats import OUTPUT_FORMATS, COMPRESSIONS, split_extension
+from msbtimes import floor_epochs, AGGREGATION_INTERVALS
+from msbpartitions import (
+    partition_keys,
+    partition_dir,
+    data_file_stats,
+    load_partition_index,
+    save_partition_index,
+    update_partition_index,
+)
+
+OUTPUT_LAYOUTS = ("flat", "partitioned")
 
 
 def parse_cmdline() -> dict:
@@ -34,7 +50,7 @@ def parse_cmdline() -> dict:
         "--interval",
         type=str,
         default="hourly",
-        help="aggregation interval. Valid descriptors are: hourly, daily or monthly",
+        help=f"aggregation interval. Valid descriptors are: {', '.join(AGGREGATION_INTERVALS)}",
     )
     cmd_parser.add_argument(
         "--timestamp-format",
@@ -42,34 +58,89 @@ def parse_cmdline() -> dict:
         default="%Y%m%dT%H%M%S%z",
         help="datetime format as being used in the data files"
     )
+    cmd_parser.add_argument(
+        "-f",
+        "--format",
+        type=str,
+        default="csv",
+        help=f"output file format. Valid formats are: {', '.join(OUTPUT_FORMATS)}",
+    )
+    cmd_parser.add_argument(
+        "--compress",
+        type=str,
+        default=None,
+        help=f"compress csv output files. Valid compressions are: {', '.join(COMPRESSIONS)}",
+    )
+    cmd_parser.add_argument(
+        "--layout",
+        type=str,
+        default="flat",
+        help="output directory layout. flat: all files in the output directory, partitioned: hive style msb=../sensor=../date=../ subdirectories plus a partition index. Default: flat",
+    )
+    cmd_parser.add_argument(
+        "--merge",
+        action="store_true",
+        help="merge the input files by epoch and drop duplicate epochs instead of concatenating them. The output is sorted and unique, each input file has to be sorted",
+    )
+    cmd_parser.add_argument(
+        "--catalog",
+        action="store_true",
+        help="record the output files in the file catalog of the output dir, see msbcatalog. An existing catalog is always kept up to date",
+    )
+    cmd_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of output files to be written in parallel. Default: 1",
+    )
     cmd_parser.add_argument("--verbose", action="store_true")
     return cmd_parser.parse_args().__dict__
 
 
-def partition_files_by_timestamp(timestamp_filepath_iterator: iter, args: dict):
-    intervals = list()
+def file_source(fpath: str, filename_sep: str = "_") -> str:
+    """returns the file name without timestamp, e.g. imu_msb-0021-a"""
+    return filename_sep.join(os.path.basename(fpath).split(filename_sep)[:-1])
+
+
+def partition_files_by_timestamp(timestamp_filepath_iterator: iter, args: dict) -> list:
+    """
+    partition_files_by_timestamp(timestamp_filepath_iterator : iter, args : dict) -> list
+
+    groups files into aggregation intervals. The interval start of all
+    timestamps is computed at once (see floor_epochs) and, together with
+    the file name without timestamp, used as bucket key, so the input does
+    not have to be sorted. Files without a valid timestamp are skipped.
+
+        Parameters:
+            timestamp_filepath_iterator: iterator over (timestamp, filepath) tuples
+            args: dictionary containing the command line parameters
+
+        Returns:
+            list of intervals in chronological order, each a list of
+            (timestamp, filepath) tuples of one source sorted by timestamp
+    """
+    timestamps_fpaths = list()
     for timestamp, fpath in timestamp_filepath_iterator:
+        if timestamp is None:
+            if args["verbose"]:
+                print(f"no valid timestamp: {fpath}, skipping")
+            continue
         if args["verbose"]:
             print(f"{timestamp} : {fpath}")
-        current_interval = [(timestamp, fpath)]
-        while True:
-            try:
-                timestamp, fpath = next(timestamp_filepath_iterator)
-            except:
-                intervals.append(current_interval)
-                break
-            if args["verbose"]:
-                print(f"{timestamp} : {fpath}")
-            if are_in_equivalent_datetime_interval(
-                timestamp=timestamp,
-                interval_boundary=current_interval[0][0],
-                interval=args["interval"],
-            ):
-                current_interval.append((timestamp, fpath))
-            else:
-                intervals.append(current_interval)
-                break
-    return intervals
+        timestamps_fpaths.append((timestamp, fpath))
+    if not timestamps_fpaths:
+        return list()
+    epochs = np.array([timestamp.timestamp() for timestamp, _ in timestamps_fpaths])
+    keys = floor_epochs(epochs, args["interval"])
+    # files of different sensors or boxes never share an output file
+    _, sources = np.unique(
+        [file_source(fpath) for _, fpath in timestamps_fpaths], return_inverse=True
+    )
+    intervals = dict()
+    for i in np.lexsort((epochs, sources, keys)):
+        intervals.setdefault((keys[i], sources[i]), list()).append(timestamps_fpaths[i])
+    return list(intervals.values())
 
 
 def make_output_path(
@@ -79,6 +150,7 @@ def make_output_path(
     timestamp,
     filename_sep="_",
     timestamp_fmt="%Y-%m-%dT%H:%M:%S%z",
+    extension=None,
 ):
     input_fname_without_timestamp = "_".join(
         input_path_example.split(os.path.sep)[-1].split(filename_sep)[:-1]
@@ -87,22 +159,137 @@ def make_output_path(
     output_fname_without_extension = filename_sep.join(
         [output_fname_prefix, datetime.strftime(timestamp, timestamp_fmt)]
     )
-    extension = input_path_example.split(".")[-1]
+    if not extension:
+        extension = ".".join(
+            filter(None, split_extension(input_path_example)[1:])
+        )
     output_path = os.path.join(
         output_dir, f"{output_fname_without_extension}.{extension}"
     )
     return output_path
 
 
-def aggregate_msbdata(args : dict):
+def interval_output_dir(interval: list, args: dict) -> str:
+    """
+    returns the output directory of an interval. In the partitioned layout
+    this is the partition of the msb, the sensor and the date the interval
+    starts at, which is created if necessary.
+    """
+    if args.get("layout", "flat") != "partitioned":
+        return args["output"]
+    msb, sensor = partition_keys(interval[0][1])
+    start = interval[0][0].timestamp()
+    if args["interval"] != "all":
+        start = floor_epochs([start], args["interval"])[0]
+    date = datetime.fromtimestamp(start, timezone.utc).strftime("%Y-%m-%d")
+    output_dir = partition_dir(args["output"], msb, sensor, date)
+    os.makedirs(output_dir, exist_ok=True)
+    return output_dir
+
+
+def aggregate_interval(interval: list, args: dict) -> tuple:
+    """
+    aggregate_interval(interval : list, args : dict) -> tuple
+
+    concatenates the files of a single interval into one output file
+
+        Parameters:
+            interval: list of (timestamp, filepath) tuples
+            args: dictionary containing the command line parameters
+
+        Returns:
+            path of the output file and, in the partitioned layout, its
+            stats for the partition index, otherwise None
+    """
+    if args["verbose"]:
+        print(f"start: {interval[0][0]} -> end: {interval[-1][0]}")
+    for _, fpath in interval:
+        if args["verbose"]:
+            print(f"    filepath: {fpath}")
+    output_path = make_output_path(
+        output_dir=interval_output_dir(interval, args),
+        output_fname_preprefix="aggregated",
+        input_path_example=interval[0][1],
+        timestamp=interval[-1][0],
+        extension=".".join(filter(None, (args["format"], args["compress"]))),
+    )
+    if args["verbose"]:
+        print(f"ouput: {output_path}")
+    if args["format"] == "csv" and all(
+        split_extension(fpath)[1] == "csv" for _, fpath in interval
+    ):
+        if args.get("merge", False):
+            merge_files(output_path, interval)
+        else:
+            concat_files(output_path, interval)
+    else:
+        concat_data_files(output_path, interval, args["format"], merge=args.get("merge", False))
+    if args.get("layout", "flat") == "partitioned":
+        return (output_path, data_file_stats(output_path))
+    return (output_path, None)
+
+
+def aggregate_intervals_parallel(intervals: list, args: dict, index: dict, output_paths: list) -> list:
+    """
+    aggregate_intervals_parallel(intervals : list, args : dict, index : dict, output_paths : list) -> list
+
+    writes the output files of the intervals concurrently using a pool of
+    args['jobs'] worker processes. Intervals are independent of each other,
+    a failing interval does not abort the remaining ones. The partition
+    index is updated in place with the stats returned by the workers, the
+    paths of the written output files are appended to output_paths.
+
+        Returns:
+            list of tuples (interval, exception) for every interval that failed
+    """
+    failed = list()
+    # every interval carries its own files, the list of all input files
+    # would otherwise be pickled along with every single interval
+    worker_args = {key: value for key, value in args.items() if key != "input"}
+    with ProcessPoolExecutor(max_workers=args["jobs"]) as executor:
+        futures = {
+            executor.submit(aggregate_interval, interval, worker_args): interval
+            for interval in intervals
+        }
+        for future in as_completed(futures):
+            interval = futures[future]
+            try:
+                output_path, stats = future.result()
+            except Exception as e:
+                print(f"failed to aggregate {interval[0][1]} .. {interval[-1][1]}: {e}")
+                failed.append((interval, e))
+                continue
+            output_paths.append(output_path)
+            if stats:
+                update_partition_index(index, args["output"], output_path, stats)
+            if args["verbose"]:
+                print(f"aggregated {output_path}")
+    return failed
+
+
+def aggregate_msbdata(args : dict) -> list:
     assert (
         args["interval"] in AGGREGATION_INTERVALS
     ), f'not a valid interval: {args["interval"]}'
+    assert (
+        args["format"] in OUTPUT_FORMATS
+    ), f'not a valid output format: {args["format"]}'
+    assert args["compress"] in (
+        None,
+        *COMPRESSIONS,
+    ), f'not a valid compression: {args["compress"]}'
+    assert not (
+        args["compress"] and args["format"] != "csv"
+    ), "--compress is only supported for csv output"
+    assert args.get("jobs", 1) > 0, f'not a valid number of jobs: {args["jobs"]}'
+    assert (
+        args.get("layout", "flat") in OUTPUT_LAYOUTS
+    ), f'not a valid output layout: {args["layout"]}'
     if args["verbose"]:
         print(f"config: {args}")
         print(f"sys.path: {sys.path}")
 
-    for interval in partition_files_by_timestamp(
+    intervals = partition_files_by_timestamp(
         extract_timestamp_fpaths(
             validate_fpaths(
                 gen_input_files(args)
@@ -110,22 +297,32 @@ def aggregate_msbdata(args : dict):
             timestamp_fmt=args['timestamp_format']
         ),
         args=args
-    ):
-        if args["verbose"]:
-            print(f"start: {interval[0][0]} -> end: {interval[-1][0]}")
-        for _, fpath in interval:
-            if args["verbose"]:
-                print(f"    filepath: {fpath}")
-        output_path = make_output_path(
-            output_dir=args["output"],
-            output_fname_preprefix="aggregated",
-            input_path_example=interval[0][1],
-            timestamp=interval[-1][0],
-        )
-        if args["verbose"]:
-            print(f"ouput: {output_path}")
-        concat_files(output_path, interval)
+    )
+    partitioned = args.get("layout", "flat") == "partitioned"
+    index = load_partition_index(args["output"]) if partitioned else dict()
+    output_paths = list()
+    if args.get("jobs", 1) > 1:
+        failed = aggregate_intervals_parallel(intervals, args, index, output_paths)
+    else:
+        failed = list()
+        for interval in intervals:
+            try:
+                output_path, stats = aggregate_interval(interval, args)
+            except Exception as e:
+                print(f"failed to aggregate {interval[0][1]} .. {interval[-1][1]}: {e}")
+                failed.append((interval, e))
+                continue
+            output_paths.append(output_path)
+            if stats:
+                update_partition_index(index, args["output"], output_path, stats)
+    if partitioned:
+        save_partition_index(args["output"], index)
+    if args.get("catalog", False) or has_catalog(args["output"]):
+        update_catalog(args["output"], output_paths, verbose=args["verbose"])
+    return failed
 
 if __name__ == "__main__":
     args = parse_cmdline()
-    aggregate_msbdata(args)
+    if failed := aggregate_msbdata(args):
+        print(f"failed to aggregate {len(failed)} interval(s)")
+        sys.exit(1)
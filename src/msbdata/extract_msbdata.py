@@ -1,40 +1,258 @@
 #!/usr/bin/env python3
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from glob import glob
 import json
 import os
 import sys
 
-from msbdata import read_parse_msblogfile, decompose_logfile_stream, validate_fpaths, gen_input_files
+from msbdata import read_parse_msblogfile_columnar, iter_parse_msblogfile_columnar, read_parse_msblogfile_parallel, merge_columnar, decompose_logfile_stream, decompose_logfile_columnar, decompose_columnar_stream, validate_fpaths, gen_input_files, LogfileCursor, LogfileFollower, DEFAULT_FLUSH_SIZE
+from msbformats import OUTPUT_FORMATS, COMPRESSIONS, detect_compression
+from msbmanifest import load_manifest, save_manifest, manifest_entry, resume_offset
+from msbcatalog import update_catalog, has_catalog
 
 # TODO
 # - check of output file exists and skip file of --overwrite has not been set
-# - use multiprocessing to process several files at once
 
 def parse_cmdline() -> dict:
     args = argparse.ArgumentParser()
     args.add_argument("input", nargs="+", default=(None if sys.stdin.isatty() else sys.stdin), help="input files to be processed. can either be stdin or a list of files")
     args.add_argument("--input-filepattern", default="*.log", type=str, help="input dir containing msb logfile")
     args.add_argument("--output-dir", "-o", default="", type=str, help="output file directory")
+    args.add_argument("--format", "-f", default="csv", type=str, help=f"output file format. Valid formats are: {', '.join(OUTPUT_FORMATS)}. Default: csv")
+    args.add_argument("--compress", default=None, type=str, help=f"compress csv output files on the fly. Valid compressions are: {', '.join(COMPRESSIONS)}. Default: None")
+    args.add_argument("--flush-size", default=DEFAULT_FLUSH_SIZE, type=int, help=f"number of rows buffered per output file before writing. Default: {DEFAULT_FLUSH_SIZE}")
+    args.add_argument("--incremental", default=False, action="store_true", help="only process data appended to the logfiles since the last run and append it to the existing output files. Progress is tracked in a manifest in the output dir")
+    args.add_argument("--follow", default=False, action="store_true", help="keep following the newest input logfile while it is written and roll over to newer logfiles matching --input-filepattern in the same directory")
+    args.add_argument("--poll-interval", default=1.0, type=float, help="in --follow mode, interval in seconds to poll for new data. Bounds the latency of the output. Default: 1.0")
+    args.add_argument("--jobs", "-j", default=1, type=int, help="number of logfiles to be processed in parallel. Default: 1")
+    args.add_argument("--split-size", default=0, type=int, help="logfiles larger than this size in MB are split into ranges of this size, which are parsed in parallel by --jobs workers. Default: 0, i.e. never split")
+    args.add_argument("--catalog", default=False, action="store_true", help="record the output files in the file catalog of the output dir, see msbcatalog. An existing catalog is always kept up to date")
     args.add_argument("--verbose", "-v", default=False, action="store_true", help="debugging output")
     config = args.parse_args().__dict__
     assert os.path.isdir(config['output_dir']), f"please provide a valid output dir"
+    assert config['format'] in OUTPUT_FORMATS, f"not a valid output format: {config['format']}"
+    assert config['compress'] in (None, *COMPRESSIONS), f"not a valid compression: {config['compress']}"
+    assert not (config['compress'] and config['format'] != 'csv'), "--compress is only supported for csv output, the other formats are compressed already"
+    assert not (config['incremental'] and config['format'] != 'csv'), "--incremental is only supported for csv output"
+    assert not (config['follow'] and config['format'] != 'csv'), "--follow is only supported for csv output"
+    assert config['jobs'] > 0, f"not a valid number of jobs: {config['jobs']}"
     return config
 
 
-def extract_msbdata(config : dict):
+def extract_logfile(logfile : str, config : dict, entry : dict = None) -> dict:
+    """
+    extract_logfile(logfile : str, config : dict, entry : dict = None) -> dict
+
+    decomposes a single msb logfile into its imu, gps and att output files.
+    The output file names only depend on the logfile name, so the result is
+    independent of the order in which logfiles are processed.
+
+    In incremental mode, only the part of the logfile appended since the
+    run recorded in entry is parsed and appended to the existing outputs.
+
+        Parameters:
+            logfile: path to the msb logfile
+            config: dictionary containing the command line parameters
+            entry: manifest entry of the logfile from a previous run
+
+        Returns:
+            the updated manifest entry in incremental mode, otherwise None
+    """
+    logfile_name = os.path.basename(logfile).split('.')[0]
+    if config.get('incremental', False):
+        stat = os.stat(logfile)
+        offset = resume_offset(stat, entry, logfile)
+        if offset is None:
+            if config['verbose']:
+                print(f'{logfile} unchanged, skipping')
+            return entry
+        if config['verbose']:
+            print(f'processing {logfile} from byte {offset}')
+        cursor = LogfileCursor(logfile, offset=offset, verbose=config['verbose'])
+        decompose_logfile_stream(cursor, logfile_name, output_dir=config['output_dir'], flush_size=config.get('flush_size', DEFAULT_FLUSH_SIZE), append=offset > 0, compression=config.get('compress'))
+        return manifest_entry(stat, cursor.offset, logfile)
+    if config.get('format', 'csv') != 'csv':
+        data, integral, bad_lines = read_parse_msblogfile_columnar(logfile, verbose=config['verbose'])
+        if bad_lines and config['verbose']:
+            print(f'skipped {bad_lines} malformed lines in {logfile}')
+        decompose_logfile_columnar(data, logfile_name, output_dir=config['output_dir'], output_format=config['format'], verbose=config['verbose'], integral=integral)
+        return None
+    bad_lines = decompose_columnar_stream(iter_parse_msblogfile_columnar(logfile, verbose=config['verbose']), logfile_name, output_dir=config['output_dir'], flush_size=config.get('flush_size', DEFAULT_FLUSH_SIZE), verbose=config['verbose'], compression=config.get('compress'))
+    if bad_lines and config['verbose']:
+        print(f'skipped {bad_lines} malformed lines in {logfile}')
+    return None
+
+
+def find_next_logfile(logfile : str, filepattern : str) -> str:
+    """
+    returns the first logfile in the directory of logfile that matches
+    filepattern and sorts after logfile, i.e. has a later timestamp in its
+    name, or None if there is none yet
+    """
+    logfile_dir = os.path.dirname(os.path.abspath(logfile))
+    for candidate in sorted(glob(os.path.join(logfile_dir, filepattern))):
+        if os.path.basename(candidate) > os.path.basename(logfile):
+            return candidate
+    return None
+
+
+def follow_msbdata(config : dict):
+    """
+    follow_msbdata(config : dict)
+
+    near real-time extraction: follows the newest of the given logfiles
+    while it is being written and rolls over to the next logfile as soon as
+    it appears. Buffered rows are flushed whenever the logfile has been
+    read up to its end, so the output lags behind by at most about one
+    poll interval. Runs until interrupted.
+    """
+    logfiles = sorted(validate_fpaths(gen_input_files(config)))
+    assert logfiles, 'no valid input logfile to follow'
+    logfile = logfiles[-1]
+    while logfile:
+        if config['verbose']:
+            print(f'following {logfile}')
+        follower = LogfileFollower(
+            logfile,
+            next_logfile=lambda: find_next_logfile(logfile, config['input_filepattern']),
+            poll_interval=config['poll_interval'],
+            verbose=config['verbose'],
+        )
+        decompose_logfile_stream(follower, os.path.basename(logfile).split('.')[0], output_dir=config['output_dir'], flush_size=config.get('flush_size', DEFAULT_FLUSH_SIZE), compression=config.get('compress'))
+        logfile = find_next_logfile(logfile, config['input_filepattern'])
+
+
+def extract_large_logfile(logfile : str, config : dict):
+    """
+    extract_large_logfile(logfile : str, config : dict)
+
+    decomposes a single large logfile using all config['jobs'] workers. The
+    memory mapped logfile is split into newline aligned ranges of
+    config['split_size'] MB, which are parsed in parallel and merged in
+    file order.
+    """
+    logfile_name = os.path.basename(logfile).split('.')[0]
+    results = read_parse_msblogfile_parallel(logfile, jobs=config['jobs'], chunk_size=config['split_size'] * 1024 * 1024, verbose=config['verbose'])
+    if config.get('format', 'csv') == 'csv':
+        bad_lines = decompose_columnar_stream(results, logfile_name, output_dir=config['output_dir'], flush_size=config.get('flush_size', DEFAULT_FLUSH_SIZE), verbose=config['verbose'], compression=config.get('compress'))
+    else:
+        data, integral, bad_lines = merge_columnar(results)
+        decompose_logfile_columnar(data, logfile_name, output_dir=config['output_dir'], output_format=config['format'], verbose=config['verbose'], integral=integral)
+    if bad_lines and config['verbose']:
+        print(f'skipped {bad_lines} malformed lines in {logfile}')
+
+
+def extract_msbdata_parallel(logfiles : list, config : dict, manifest : dict) -> list:
+    """
+    extract_msbdata_parallel(logfiles : list, config : dict, manifest : dict) -> list
+
+    distributes the given logfiles over a pool of config['jobs'] worker
+    processes. A failing logfile does not abort the remaining ones. The
+    manifest is updated in place with the entries returned by the workers.
+
+        Returns:
+            list of tuples (logfile, exception) for every logfile that failed
+    """
+    failed = list()
+    # the list of input files is not needed by the workers and would be
+    # pickled along with every single logfile otherwise
+    worker_config = {key: value for key, value in config.items() if key != 'input'}
+    with ProcessPoolExecutor(max_workers=config['jobs']) as executor:
+        futures = {
+            executor.submit(extract_logfile, logfile, worker_config, manifest.get(os.path.abspath(logfile))) : logfile
+            for logfile in logfiles
+        }
+        for future in as_completed(futures):
+            logfile = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                print(f'failed to extract {logfile}: {e}')
+                failed.append((logfile, e))
+                continue
+            if entry:
+                manifest[os.path.abspath(logfile)] = entry
+            if config['verbose']:
+                print(f'extracted {logfile}')
+    return failed
+
+
+def extracted_files(output_dir : str, logfiles : list) -> list:
+    """
+    returns the output files of the given logfiles, which are named
+    <sensor>/<sensor>_<logfile name>.<ext> in output_dir
+    """
+    logfile_names = {os.path.basename(logfile).split('.')[0] for logfile in logfiles}
+    output_files = list()
+    for sensor_dir in os.scandir(output_dir):
+        if not sensor_dir.is_dir():
+            continue
+        output_files += [
+            output_file.path for output_file in os.scandir(sensor_dir.path)
+            if output_file.name.split('.')[0].split('_', 1)[-1] in logfile_names
+        ]
+    return output_files
+
+
+def extract_msbdata(config : dict) -> list:
     #for logfile in sorted(glob(os.path.join(config['input_dir'], config['input_filepattern']))):
+    logfiles = list()
     for logfile in validate_fpaths(gen_input_files(config)):
-        logfile_name = os.path.basename(logfile).split('.')[0]
         if not os.path.isfile(logfile):
             if config['verbose']:
                 print(f'not a valid file {logfile}, skipping')
             continue
-        decompose_logfile_stream(read_parse_msblogfile(logfile, verbose=config['verbose']), logfile_name, output_dir=config['output_dir'])
+        logfiles.append(logfile)
+
+    all_logfiles = list(logfiles)
+    incremental = config.get('incremental', False)
+    manifest = load_manifest(config['output_dir']) if incremental else dict()
+
+    failed = list()
+    if config.get('split_size', 0) > 0 and not incremental:
+        # compressed logfiles cannot be memory mapped, they are streamed instead
+        large_logfiles = [
+            logfile for logfile in logfiles
+            if os.path.getsize(logfile) > config['split_size'] * 1024 * 1024 and not detect_compression(logfile)
+        ]
+        logfiles = [logfile for logfile in logfiles if logfile not in large_logfiles]
+        for logfile in large_logfiles:
+            try:
+                extract_large_logfile(logfile, config)
+            except Exception as e:
+                print(f'failed to extract {logfile}: {e}')
+                failed.append((logfile, e))
+
+    if config.get('jobs', 1) > 1:
+        failed += extract_msbdata_parallel(logfiles, config, manifest)
+    else:
+        for logfile in logfiles:
+            try:
+                entry = extract_logfile(logfile, config, manifest.get(os.path.abspath(logfile)))
+            except Exception as e:
+                print(f'failed to extract {logfile}: {e}')
+                failed.append((logfile, e))
+                continue
+            if entry:
+                manifest[os.path.abspath(logfile)] = entry
+
+    if incremental:
+        save_manifest(config['output_dir'], manifest)
+    if config.get('catalog', False) or has_catalog(config['output_dir']):
+        update_catalog(config['output_dir'], extracted_files(config['output_dir'], all_logfiles), verbose=config['verbose'])
+    return failed
 
 
 if __name__ == "__main__":
     config = parse_cmdline()
-    extract_msbdata(config)
-
+    if config['follow']:
+        try:
+            follow_msbdata(config)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+    if failed := extract_msbdata(config):
+        print(f'failed to extract {len(failed)} logfile(s)')
+        sys.exit(1)
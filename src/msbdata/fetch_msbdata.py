@@ -1,17 +1,26 @@
 #!/usr/bin/env python3
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from config import REMOTE_SERVER, MSB_LIST, MSB_LOCAL_DATA_DIR
 from datetime import datetime, timezone
 # import fabric
 import os
 import sys
+import threading
 import time
 
-from msbdata import fetch_remote_datafile_paths, extract_timestamp_fpath
-from msbhosts import assemble_hosts
-from msbtimes import parse_begin_end
-from scp import copy_remote_datafile
+from msbdata import fetch_remote_datafile_stats, extract_epochs_fpaths
+from msbmanifest import load_manifest, save_manifest, fetch_offset, file_md5, FETCH_MANIFEST_FILENAME
+from msbcatalog import update_catalog, has_catalog
+from msbhosts import assemble_hosts, HOST_REGISTRY_TTL
+from msbtimes import parse_begin_end, NO_EPOCH
+from rsync import copy_remote_datafiles, TRANSFER_MODES
+from scp import copy_remote_datafile, resume_remote_datafile
+from ssh import ssh_sessions
+
+# cached remote file listing, kept next to the fetch manifest
+LISTING_CACHE_FILENAME = ".msbfetch_listing.json"
 
 # TODO
 # - add --ip option to retrieve directly via a user provided ip address
@@ -60,7 +69,58 @@ def parse_validate_cmdline() -> dict:
         type=str,
         help='use to select files based on a time stamp',
     )
+    cmd_parser.add_argument(
+        "--box-transfers",
+        type=int,
+        default=2,
+        help="maximum number of concurrent transfers per motion sensor box. Default: 2",
+    )
+    cmd_parser.add_argument(
+        "--max-transfers",
+        type=int,
+        default=8,
+        help="maximum number of concurrent transfers over all motion sensor boxes. Default: 8",
+    )
+    cmd_parser.add_argument(
+        "--transfer",
+        type=str,
+        default="scp",
+        help=f"transfer mode. scp: one scp per file, rsync/tar: all files of a box in one compressed stream. Valid modes are: {', '.join(TRANSFER_MODES)}. Default: scp",
+    )
+    cmd_parser.add_argument(
+        "--checksum",
+        action="store_true",
+        default=False,
+        help="verify the local part of a file by its md5 checksum before resuming its transfer and record checksums in the fetch manifest",
+    )
+    cmd_parser.add_argument(
+        "--force",
+        action="store_true",
+        default=False,
+        help="transfer all selected files, even if they have been fetched before",
+    )
+    cmd_parser.add_argument(
+        "--listing-ttl",
+        type=float,
+        default=60,
+        help="seconds a remote file listing is reused by subsequent runs. 0 disables the cache. Default: 60",
+    )
+    cmd_parser.add_argument(
+        "--host-ttl",
+        type=float,
+        default=HOST_REGISTRY_TTL,
+        help=f"seconds the reachability of a box is taken from the host registry instead of probing it again. 0 probes all boxes. Default: {HOST_REGISTRY_TTL}",
+    )
+    cmd_parser.add_argument(
+        "--catalog",
+        action="store_true",
+        default=False,
+        help="record the fetched files in the file catalog of MSB_LOCAL_DATA_DIR/<serial>, see msbcatalog. An existing catalog is always kept up to date",
+    )
     args = cmd_parser.parse_args().__dict__
+    assert args["transfer"] in TRANSFER_MODES, f'not a valid transfer mode: {args["transfer"]}'
+    assert args["box_transfers"] > 0, f'not a valid number of transfers: {args["box_transfers"]}'
+    assert args["max_transfers"] > 0, f'not a valid number of transfers: {args["max_transfers"]}'
     assert os.path.isdir(args["output_dir"]), f'not a directory: {args["output"]}'
     assert args["msb"], print(
         "please provide at least one motion sensor box serial number via\
@@ -68,7 +128,183 @@ the --msb command line parameter"
         )
     return args
 
-def fetch_msbdata(config : dict):
+def transfer_datafile(remote_datafile : tuple, serialnumber : str, ssh_access_string : str, config : dict, transfer_slots : threading.Semaphore) -> int:
+    """
+    transfers a single remote file, given as (path, size, mtime, offset)
+    tuple, either completely or from offset on
+    """
+    remote_datafile_path, _, _, offset = remote_datafile
+    with transfer_slots:
+        if offset:
+            return resume_remote_datafile(remote_datafile_path, serialnumber, ssh_access_string, offset, verify=config.get("checksum", False), verbose=config["verbose"])
+        return copy_remote_datafile(remote_datafile_path, serialnumber, config, verbose=config["verbose"])
+
+
+def manifest_record(remote_datafile : tuple, local_data_dir : str, config : dict) -> dict:
+    remote_datafile_path, size, mtime, _ = remote_datafile
+    entry = {"size": size, "mtime": mtime}
+    if config.get("checksum", False):
+        entry["md5"] = file_md5(os.path.join(local_data_dir, os.path.basename(remote_datafile_path)))
+    return entry
+
+
+def select_remote_datafiles(remote_datafile_stats : iter, local_data_dir : str, manifest : dict, config : dict, begin : datetime, end : datetime, report : dict) -> list:
+    """
+    select_remote_datafiles(remote_datafile_stats : iter, local_data_dir : str, manifest : dict, config : dict, begin : datetime, end : datetime, report : dict) -> list
+
+    selects the remote files within [begin, end] that are missing locally,
+    incomplete or have changed since they were fetched
+
+        Returns:
+            list of (path, size, mtime, offset) tuples, see fetch_offset
+    """
+    remote_datafiles = list()
+    remote_datafile_stats = list(remote_datafile_stats)
+    epochs = extract_epochs_fpaths(
+        [remote_datafile_path for remote_datafile_path, _, _ in remote_datafile_stats],
+        timestamp_fmt=config['datetime_format'],
+    )
+    for epoch, (remote_datafile_path, size, mtime) in zip(epochs.tolist(), remote_datafile_stats):
+        if epoch != NO_EPOCH:
+            if config['verbose']:
+                print(f'extracted timestamp: {datetime.fromtimestamp(epoch, timezone.utc)}')
+            if not begin.timestamp() <= epoch <= end.timestamp():
+                continue
+            if config['list_available_data']:
+                print(remote_datafile_path)
+            report["files"] += 1
+            local_path = os.path.join(local_data_dir, os.path.basename(remote_datafile_path))
+            local_size = os.path.getsize(local_path) if os.path.isfile(local_path) else 0
+            offset = 0 if config.get("force", False) else fetch_offset(size, mtime, manifest.get(remote_datafile_path), local_size)
+            if offset is None:
+                report["skipped"] += 1
+                continue
+            remote_datafiles.append((remote_datafile_path, size, mtime, offset))
+    return remote_datafiles
+
+
+def list_remote_datafiles(serialnumber : str, ssh_access_string : str, local_data_dir : str, config : dict, begin : datetime) -> list:
+    """
+    list_remote_datafiles(serialnumber : str, ssh_access_string : str, local_data_dir : str, config : dict, begin : datetime) -> list
+
+    returns the (path, size, mtime) tuples of the remote files modified
+    since begin. The box filters the files itself, see
+    fetch_remote_datafile_stats. The listing is cached locally and reused
+    for config['listing_ttl'] seconds, as long as it covers begin.
+    """
+    cache = load_manifest(local_data_dir, LISTING_CACHE_FILENAME)
+    ttl = config.get("listing_ttl", 0)
+    if (
+        cache
+        and time.time() - cache["time"] < ttl
+        and cache["begin"] <= begin.timestamp()
+    ):
+        if config["verbose"]:
+            print(f"{serialnumber}: using cached listing from {cache['time']}")
+        return [tuple(remote_datafile) for remote_datafile in cache["files"]]
+    t_listing = time.time()
+    remote_datafile_stats = list(
+        fetch_remote_datafile_stats(serialnumber, ssh_access_string, begin=begin.timestamp(), verbose=config["verbose"])
+    )
+    if ttl > 0:
+        save_manifest(
+            local_data_dir,
+            {"time": t_listing, "begin": begin.timestamp(), "files": remote_datafile_stats},
+            LISTING_CACHE_FILENAME,
+        )
+    return remote_datafile_stats
+
+
+def fetch_box(serialnumber : str, config : dict, begin : datetime, end : datetime, transfer_slots : threading.Semaphore) -> dict:
+    """
+    fetch_box(serialnumber : str, config : dict, begin : datetime, end : datetime, transfer_slots : threading.Semaphore) -> dict
+
+    fetches all files of a single motion sensor box within [begin, end].
+    Files that are already complete locally are skipped, see the fetch
+    manifest in MSB_LOCAL_DATA_DIR/<serial>, incomplete and grown files
+    are resumed.
+    In the batched transfer modes (rsync, tar) all files are sent in one
+    stream. Otherwise up to config['box_transfers'] files are copied
+    concurrently. Every transfer needs one of the global transfer_slots.
+
+        Returns:
+            report of the box containing whether it was reachable, the
+            number of selected, skipped, copied and failed files and the
+            duration
+    """
+    report = {"msb": serialnumber, "reachable": False, "files": 0, "skipped": 0, "copied": 0, "failed": list(), "seconds": 0.0}
+    t_start = time.time()
+    local_data_dir = os.path.join(MSB_LOCAL_DATA_DIR, serialnumber)
+    for serialnumber, ssh_access_string in assemble_hosts(
+        [serialnumber], remote=config["remote"], verbose=config["verbose"], ttl=config.get("host_ttl", HOST_REGISTRY_TTL)
+    ):
+        report["reachable"] = True
+        if config["verbose"]:
+            print(serialnumber, ssh_access_string)
+        os.makedirs(local_data_dir, exist_ok=True)
+        manifest = load_manifest(local_data_dir, FETCH_MANIFEST_FILENAME)
+        remote_datafiles = select_remote_datafiles(
+            list_remote_datafiles(serialnumber, ssh_access_string, local_data_dir, config, begin),
+            local_data_dir, manifest, config, begin, end, report,
+        )
+        try:
+            if config.get("transfer", "scp") != "scp":
+                # rsync only appends to the files fetch_offset found to be
+                # resumable, tar always sends whole files
+                append_paths = {remote_datafile[0] for remote_datafile in remote_datafiles if remote_datafile[3] > 0}
+                with transfer_slots:
+                    returncode = copy_remote_datafiles([remote_datafile[0] for remote_datafile in remote_datafiles], serialnumber, config, append_paths=append_paths, verbose=config["verbose"])
+                if returncode:
+                    print(f"{serialnumber}: {config['transfer']} transfer failed: {returncode}")
+                    report["failed"] = [remote_datafile[0] for remote_datafile in remote_datafiles]
+                else:
+                    report["copied"] = len(remote_datafiles)
+                    for remote_datafile in remote_datafiles:
+                        manifest[remote_datafile[0]] = manifest_record(remote_datafile, local_data_dir, config)
+                continue
+            with ThreadPoolExecutor(max_workers=config["box_transfers"]) as executor:
+                futures = {
+                    executor.submit(transfer_datafile, remote_datafile, serialnumber, ssh_access_string, config, transfer_slots) : remote_datafile
+                    for remote_datafile in remote_datafiles
+                }
+                for future in as_completed(futures):
+                    remote_datafile = futures[future]
+                    try:
+                        returncode = future.result()
+                    except Exception as e:
+                        returncode = e
+                    if returncode:
+                        print(f"{serialnumber}: failed to copy {remote_datafile[0]}: {returncode}")
+                        report["failed"].append(remote_datafile[0])
+                    else:
+                        report["copied"] += 1
+                        manifest[remote_datafile[0]] = manifest_record(remote_datafile, local_data_dir, config)
+                        if config["verbose"]:
+                            print(f"{serialnumber}: copied {report['copied']}/{len(remote_datafiles)} {remote_datafile[0]}")
+        finally:
+            save_manifest(local_data_dir, manifest, FETCH_MANIFEST_FILENAME)
+            if remote_datafiles and (config.get("catalog", False) or has_catalog(local_data_dir)):
+                update_catalog(
+                    local_data_dir,
+                    [os.path.join(local_data_dir, os.path.basename(remote_datafile[0])) for remote_datafile in remote_datafiles],
+                    verbose=config["verbose"],
+                )
+    report["seconds"] = time.time() - t_start
+    return report
+
+
+def fetch_msbdata(config : dict) -> list:
+    """
+    fetch_msbdata(config : dict) -> list
+
+    fetches the data of all requested motion sensor boxes concurrently. A
+    slow or unreachable box only delays its own transfers. The number of
+    concurrent transfers is limited per box (config['box_transfers']) and
+    in total (config['max_transfers']).
+
+        Returns:
+            list of per box reports, see fetch_box
+    """
     if config["verbose"]:
         print(config)
 
@@ -76,21 +312,36 @@ def fetch_msbdata(config : dict):
     if config['verbose']:
         print(f"begin: {begin} -> end: {end}")
 
-    for serialnumber, ssh_access_string in assemble_hosts(
-        config["msb"], remote=config["remote"], verbose=config["verbose"]
-    ):
-        print(serialnumber, ssh_access_string)
-        for remote_datafile_path in fetch_remote_datafile_paths(
-            serialnumber, ssh_access_string, verbose=config["verbose"]
-        ):
-            if remote_datafile_ts := extract_datetime_fpath(remote_datafile_path, datetime_fmt=config['datetime_format']):
-                if config['verbose']:
-                    print(f'extracted timestamp: {remote_datafile_ts}')
-                if begin <= remote_datafile_ts <= end:
-                    if config['list_available_data']:
-                        print(remote_datafile_path)
-                    copy_remote_datafile(remote_datafile_path, serialnumber, config, verbose=True)
+    transfer_slots = threading.BoundedSemaphore(config.get("max_transfers", 8))
+    reports = list()
+    with ThreadPoolExecutor(max_workers=len(config["msb"])) as executor:
+        futures = {
+            executor.submit(fetch_box, serialnumber.lower(), config, begin, end, transfer_slots) : serialnumber
+            for serialnumber in config["msb"]
+        }
+        for future in as_completed(futures):
+            try:
+                report = future.result()
+            except Exception as e:
+                report = {"msb": futures[future], "reachable": True, "files": 0, "skipped": 0, "copied": 0, "failed": list(), "error": str(e), "seconds": 0.0}
+            print_report(report)
+            reports.append(report)
+    return reports
+
+
+def print_report(report : dict):
+    if not report["reachable"]:
+        print(f'{report["msb"]}: not reachable')
+    elif "error" in report:
+        print(f'{report["msb"]}: failed: {report["error"]}')
+    else:
+        print(f'{report["msb"]}: {report["files"]} files, {report["skipped"]} up to date, {report["copied"]} copied, {len(report["failed"])} failed, {report["seconds"]:.1f} s')
+
 
 if __name__ == "__main__":
     config = parse_validate_cmdline()
-    fetch_msbdata(config)
+    # one multiplexed ssh session per box for the listing and all transfers
+    with ssh_sessions():
+        reports = fetch_msbdata(config)
+    if any(report["failed"] or "error" in report for report in reports):
+        sys.exit(1)
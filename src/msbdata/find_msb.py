@@ -12,8 +12,9 @@ import os
 import sys
 
 from config import MSB_LIST, CMD_GPSD_LAT_LON
-from msbhosts import assemble_hosts
-from ssh import ssh_exec
+from msbhosts import assemble_hosts, HOST_REGISTRY_TTL
+from ssh import ssh_exec, ssh_sessions
+from msb_statusd import query_status, DEFAULT_PORT
 
 def parse_validate_cmdline() -> dict:
     cmd_parser = argparse.ArgumentParser()
@@ -49,29 +50,71 @@ def parse_validate_cmdline() -> dict:
         action="store_true",
         default=False,
     )
+    cmd_parser.add_argument(
+        "--refresh",
+        help=f"probe all motion sensor boxes instead of using the results of probes of the last {HOST_REGISTRY_TTL} s",
+        action="store_true",
+        default=False,
+    )
+    cmd_parser.add_argument(
+        "--statusd",
+        nargs="?",
+        const=DEFAULT_PORT,
+        default=None,
+        type=int,
+        help=f"take reachability and gps coordinates from a running msb_statusd instead of asking the boxes. Default port: {DEFAULT_PORT}",
+    )
     args = cmd_parser.parse_args().__dict__
     return args
 
 
+def print_position(lat, lon, maps : bool):
+    if maps:
+        print(f" https://www.google.com/maps/search/?api=1&query={lat},{lon}", end="")
+    else:
+        print(f" latitude: {lat} longitude: {lon}", end="")
+
+
+def find_msb_statusd(config: dict):
+    """like find_msb, but answered from the memory of msb_statusd within milliseconds"""
+    fleet_status = query_status(port=config["statusd"])
+    for host in MSB_LIST:
+        status = fleet_status.get(host)
+        if not status or not status["reachable"]:
+            continue
+        print(host, status["access"], end="")
+        if config['gps']:
+            if status.get("lat") is not None:
+                print_position(status["lat"], status["lon"], config['maps'])
+            else:
+                print("print failed to retrieve gps latitude and longitude")
+        print("")
+
+
 def find_msb(config: dict):
     if config["verbose"]:
         print(json.dumps(config))
     config["msb"] = MSB_LIST
     for host, access in assemble_hosts(
-        config["msb"], remote=config["remote"], verbose=config["verbose"]
+        config["msb"],
+        remote=config["remote"],
+        verbose=config["verbose"],
+        ttl=0 if config["refresh"] else HOST_REGISTRY_TTL,
     ):
         print(host, access, end="")
         if config['gps']:
             if ssh_response := ssh_exec(access, cmd=CMD_GPSD_LAT_LON):
                 lat, lon = ssh_response.replace('\n', '').split(',')
-                if config['maps']:
-                    print(f" https://www.google.com/maps/search/?api=1&query={lat},{lon}", end="")
-                else:
-                    print(f" latitude: {lat} longitude: {lon}", end="")
+                print_position(lat, lon, config['maps'])
             else:
                 print("print failed to retrieve gps latitude and longitude")
         print("")
 
 if __name__ == "__main__":
     config = parse_validate_cmdline()
-    find_msb(config)
+    if config["statusd"]:
+        find_msb_statusd(config)
+        sys.exit(0)
+    # the hostname lookup and the gps query share one ssh session per box
+    with ssh_sessions():
+        find_msb(config)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+import argparse
+from datetime import datetime, timezone
+import json
+import math
+import os
+import random
+
+# TODO
+# - add a topic for the raspberry pi system metrics
+
+DEFAULT_RATES = {"imu": 50.0, "att": 10.0, "gps": 1.0}
+
+
+def parse_cmdline() -> dict:
+    cmd_parser = argparse.ArgumentParser(
+        description="generate synthetic motion sensor box logfiles for testing and benchmarking"
+    )
+    cmd_parser.add_argument("-o", "--output-dir", required=True, type=str, help="output directory")
+    cmd_parser.add_argument("--msb", default="msb-0001-a", type=str, help="motion sensor box serial number used in the file names")
+    cmd_parser.add_argument("--begin", default="2022-02-06T13:00:00+00:00", type=str, help="timestamp of the first sample")
+    cmd_parser.add_argument("--duration", default=300.0, type=float, help="duration covered by a single logfile in seconds. Default: 300")
+    cmd_parser.add_argument("--files", default=1, type=int, help="number of consecutive logfiles. Default: 1")
+    cmd_parser.add_argument("--size", default=None, type=float, help="approximate size of a single logfile in MB. Overrides --duration")
+    cmd_parser.add_argument("--imu-rate", default=DEFAULT_RATES["imu"], type=float, help="imu sampling rate in Hz")
+    cmd_parser.add_argument("--att-rate", default=DEFAULT_RATES["att"], type=float, help="attitude sampling rate in Hz")
+    cmd_parser.add_argument("--gps-rate", default=DEFAULT_RATES["gps"], type=float, help="gps sampling rate in Hz")
+    cmd_parser.add_argument("--malformed", default=0.001, type=float, help="fraction of malformed lines. Default: 0.001")
+    cmd_parser.add_argument("--gaps", default=0.0, type=float, help="probability per second of a recording gap. Default: 0")
+    cmd_parser.add_argument("--gap-duration", default=10.0, type=float, help="duration of a recording gap in seconds. Default: 10")
+    cmd_parser.add_argument("--no-fix", default=0.05, type=float, help="fraction of gps samples without a fix. Default: 0.05")
+    cmd_parser.add_argument("--seed", default=0, type=int, help="random seed, the output is reproducible for a given seed")
+    cmd_parser.add_argument("--timestamp-format", default="%Y-%m-%dT%H-%M-%S", type=str, help="datetime format of the timestamp in the file names")
+    cmd_parser.add_argument("--verbose", action="store_true")
+    config = cmd_parser.parse_args().__dict__
+    assert os.path.isdir(config["output_dir"]), f'not a directory: {config["output_dir"]}'
+    return config
+
+
+def imu_sample(t: float, rng: random.Random) -> list:
+    # buoy like motion: a swell of a few seconds period on top of gravity.
+    # Same layout as tests/csv_testfiles/imu: epoch, acc, rot, mag, temp
+    swell = 0.2 * math.sin(2 * math.pi * t / 7.0)
+    return [
+        t,
+        -1.0 + swell + rng.gauss(0, 0.002),
+        0.02 * math.cos(2 * math.pi * t / 7.0) + rng.gauss(0, 0.002),
+        0.005 + rng.gauss(0, 0.002),
+        rng.gauss(0, 0.1),
+        rng.gauss(0.2, 0.1),
+        rng.gauss(0, 0.1),
+        rng.randint(-260, -240),
+        rng.randint(260, 280),
+        rng.randint(315, 335),
+        rng.choice((4240, 4256, 4288, 4304, 4320, 4352)),
+    ]
+
+
+def att_sample(t: float, uptime: float, rng: random.Random) -> list:
+    return [
+        t,
+        round(uptime, 3),
+        5.0 * math.sin(2 * math.pi * t / 7.0) + rng.gauss(0, 0.05),
+        2.0 * math.cos(2 * math.pi * t / 7.0) + rng.gauss(0, 0.05),
+        180.0 + rng.gauss(0, 0.5),
+    ]
+
+
+def gps_sample(t: float, uptime: float, rng: random.Random, no_fix: float) -> list:
+    data = {
+        "time": datetime.fromtimestamp(int(t), timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    }
+    if rng.random() >= no_fix:
+        data["lat"] = round(53.1115 + rng.gauss(0, 1e-5), 7)
+        data["lon"] = round(8.8562 + rng.gauss(0, 1e-5), 7)
+        data["alt"] = round(172.0 + rng.gauss(0, 0.5), 3)
+    return [t, round(uptime, 3), data]
+
+
+def malformed_line(line: str, rng: random.Random) -> str:
+    if rng.random() < 0.5:
+        # a line truncated while being written, e.g. after a power loss
+        return line[: rng.randint(1, len(line) - 1)] + "\n"
+    return line[:-3] + ", nan, }}\n"
+
+
+def gen_msblog_lines(begin: float, duration: float, config: dict, rng: random.Random) -> iter:
+    """
+    gen_msblog_lines(begin : float, duration : float, config : dict, rng : random.Random) -> iter
+
+    generates the lines of a synthetic msb logfile covering [begin, begin + duration).
+    Samples of the imu, att and gps topics are interleaved in time order at
+    the configured rates. A fraction of lines is malformed and recording
+    gaps are inserted at random.
+    """
+    rates = {"imu": config["imu_rate"], "att": config["att_rate"], "gps": config["gps_rate"]}
+    next_sample = {topic: begin for topic, rate in rates.items() if rate > 0}
+    end = begin + duration
+    gap_end = begin
+    second = math.floor(begin)
+    while next_sample:
+        topic, t = min(next_sample.items(), key=lambda item: item[1])
+        if t >= end:
+            break
+        next_sample[topic] = t + 1.0 / rates[topic]
+        if math.floor(t) != second:
+            second = math.floor(t)
+            if rng.random() < config["gaps"]:
+                gap_end = t + config["gap_duration"]
+        if t < gap_end:
+            continue
+        uptime = t - config["boot_epoch"]
+        if topic == "imu":
+            sample = imu_sample(t, rng)
+        elif topic == "att":
+            sample = att_sample(t, uptime, rng)
+        else:
+            sample = gps_sample(t, uptime, rng, config["no_fix"])
+        line = json.dumps({topic: sample}) + "\n"
+        if rng.random() < config["malformed"]:
+            line = malformed_line(line, rng)
+        yield line
+
+
+def bytes_per_second(config: dict) -> float:
+    """approximate size of one second of log data in bytes"""
+    return 185 * config["imu_rate"] + 105 * config["att_rate"] + 130 * config["gps_rate"]
+
+
+def gen_msblogs(config: dict) -> list:
+    """
+    gen_msblogs(config : dict) -> list
+
+    writes config['files'] consecutive synthetic logfiles to
+    config['output_dir'] and returns their paths
+    """
+    rng = random.Random(config["seed"])
+    begin = datetime.fromisoformat(config["begin"])
+    # an explicit utc offset is honoured, timestamps without one are utc
+    if begin.tzinfo:
+        begin = begin.astimezone(timezone.utc)
+    else:
+        begin = begin.replace(tzinfo=timezone.utc)
+    begin = begin.timestamp()
+    duration = config["duration"]
+    if config.get("size"):
+        duration = config["size"] * 1024 * 1024 / bytes_per_second(config)
+    config.setdefault("boot_epoch", begin - 100.0)
+    logfiles = list()
+    for i in range(config["files"]):
+        file_begin = begin + i * duration
+        timestamp = datetime.fromtimestamp(file_begin, timezone.utc).strftime(config["timestamp_format"])
+        logfile = os.path.join(config["output_dir"], f'{config["msb"]}_{timestamp}.log')
+        with open(logfile, "w") as logfile_fhandle:
+            logfile_fhandle.writelines(gen_msblog_lines(file_begin, duration, config, rng))
+        if config["verbose"]:
+            print(f"generated {logfile} ({os.path.getsize(logfile)} bytes)")
+        logfiles.append(logfile)
+    return logfiles
+
+
+if __name__ == "__main__":
+    config = parse_cmdline()
+    for logfile in gen_msblogs(config):
+        print(logfile)
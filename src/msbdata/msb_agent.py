@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+# runs on the motion sensor box itself, see summarize_msbdata.py. Only the
+# python standard library is available there, so neither numpy nor pandas
+# nor any of the other msbdata modules may be imported here.
+
+import argparse
+from glob import glob
+import gzip
+import json
+import math
+import os
+import socket
+import time
+
+DEFAULT_DATA_DIR = "/home/pi/msb_data"
+
+
+def parse_cmdline() -> dict:
+    cmd_parser = argparse.ArgumentParser(
+        description="summarize the raw msb logfiles on the box: block statistics of the absolute acceleration and a decimated gps track"
+    )
+    cmd_parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, type=str, help=f"directory containing the msb logfiles. Default: {DEFAULT_DATA_DIR}")
+    cmd_parser.add_argument("--begin", default=0.0, type=float, help="unix epoch of the first sample to be considered")
+    cmd_parser.add_argument("--end", default=None, type=float, help="unix epoch of the last sample to be considered. Default: now")
+    cmd_parser.add_argument("--block", default=600, type=int, help="block length in seconds. Default: 600")
+    cmd_parser.add_argument("--gps-interval", default=60, type=float, help="minimum interval between gps fixes in seconds. Default: 60")
+    config = cmd_parser.parse_args().__dict__
+    if config["end"] is None:
+        config["end"] = time.time()
+    return config
+
+
+class BlockStatistics:
+    """
+    running maximum (and its epoch), count and standard deviation of a
+    block of samples. The standard deviation uses Welford's algorithm and
+    ddof=1, like pandas does.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.max = -math.inf
+        self.max_epoch = None
+
+    def add(self, epoch: float, value: float):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+        if value > self.max:
+            self.max = value
+            self.max_epoch = epoch
+
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else None
+
+
+def open_logfile(logfile: str):
+    if logfile.endswith(".gz"):
+        return gzip.open(logfile, "rt")
+    return open(logfile, "r")
+
+
+def summarize_logfiles(logfiles: list, config: dict) -> dict:
+    """
+    summarize_logfiles(logfiles : list, config : dict) -> dict
+
+    streams the logfiles once and returns the statistics of the absolute
+    acceleration per block and every gps fix that is at least
+    config['gps_interval'] seconds after the previous one
+    """
+    blocks = dict()
+    gps = list()
+    last_fix = -math.inf
+    for logfile in logfiles:
+        with open_logfile(logfile) as logfile_fhandle:
+            for line in logfile_fhandle:
+                try:
+                    data = json.loads(line)
+                    if "imu" in data:
+                        epoch, acc_x, acc_y, acc_z = data["imu"][:4]
+                        acc_abs = math.sqrt(acc_x * acc_x + acc_y * acc_y + acc_z * acc_z)
+                    elif "gps" in data:
+                        epoch, _, fix = data["gps"][:3]
+                        lat, lon = fix.get("lat"), fix.get("lon")
+                    else:
+                        continue
+                except (ValueError, TypeError, KeyError, AttributeError):
+                    # malformed line
+                    continue
+                if "imu" in data:
+                    if not config["begin"] <= epoch <= config["end"]:
+                        continue
+                    block = int(epoch // config["block"]) * config["block"]
+                    if block not in blocks:
+                        blocks[block] = BlockStatistics()
+                    blocks[block].add(epoch, acc_abs)
+                else:
+                    if not config["begin"] <= epoch <= config["end"]:
+                        continue
+                    # no fix, lat and lon are missing or 0
+                    if not lat or not lon:
+                        continue
+                    if epoch - last_fix < config["gps_interval"]:
+                        continue
+                    last_fix = epoch
+                    gps.append([epoch, lat, lon, fix.get("alt")])
+    return {
+        "blocks": [
+            [block, stats.max_epoch, stats.max, stats.std(), stats.n]
+            for block, stats in sorted(blocks.items())
+        ],
+        "gps": sorted(gps),
+    }
+
+
+def find_logfiles(config: dict) -> list:
+    """logfiles modified since begin, a logfile is written after its creation"""
+    return sorted(
+        logfile
+        for logfile in glob(os.path.join(config["data_dir"], "*.log*"))
+        if os.path.getmtime(logfile) >= config["begin"]
+    )
+
+
+if __name__ == "__main__":
+    config = parse_cmdline()
+    summary = summarize_logfiles(find_logfiles(config), config)
+    summary.update(msb=socket.gethostname(), begin=config["begin"], end=config["end"], block=config["block"])
+    print(json.dumps(summary, separators=(",", ":")))
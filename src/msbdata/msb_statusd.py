@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import sys
+import threading
+import time
+import urllib.request
+
+from config import MSB_LIST, MSB_REMOTE_DATA_DIR, CMD_GPSD_LAT_LON
+from msbhosts import probe_host
+from ssh import ssh_exec, ssh_sessions
+
+# TODO
+# - add the uptime and the cpu temperature of the boxes
+
+DEFAULT_PORT = 8421
+STATUS_SEPARATOR = "---"
+
+
+def parse_cmdline() -> dict:
+    cmd_parser = argparse.ArgumentParser(
+        description="poll the status of the motion sensor boxes in the background and serve it via http on localhost"
+    )
+    cmd_parser.add_argument("--msb", nargs="+", default=MSB_LIST, help="motion sensor box serial numbers to be polled. Default: all")
+    cmd_parser.add_argument("-r", "--remote", action="store_true", default=False, help="poll via reverse ssh tunnels on a remote server")
+    cmd_parser.add_argument("--interval", default=300, type=float, help="seconds between two polls of the fleet. Default: 300")
+    cmd_parser.add_argument("-j", "--jobs", default=8, type=int, help="number of boxes polled concurrently. Default: 8")
+    cmd_parser.add_argument("--port", default=DEFAULT_PORT, type=int, help=f"port of the http interface on localhost. Default: {DEFAULT_PORT}")
+    cmd_parser.add_argument("--fake", action="store_true", default=False, help="poll simulated boxes instead of real ones, for testing without network access")
+    cmd_parser.add_argument("--query", nargs="?", const="", default=None, help="query a running daemon for the status of all boxes, or of the given serial number, and exit")
+    cmd_parser.add_argument("--verbose", action="store_true")
+    config = cmd_parser.parse_args().__dict__
+    assert config["jobs"] > 0, f'not a valid number of jobs: {config["jobs"]}'
+    return config
+
+
+def assemble_status_cmd() -> str:
+    """a single remote command collecting disk usage, newest file and position"""
+    return (
+        f'"df -P {MSB_REMOTE_DATA_DIR} | tail -n 1; echo {STATUS_SEPARATOR};'
+        f" find {MSB_REMOTE_DATA_DIR} -type f -printf '%T@ %f\\n' | sort -n | tail -n 1; echo {STATUS_SEPARATOR};"
+        f' {CMD_GPSD_LAT_LON}"'
+    )
+
+
+def parse_status_output(output: str) -> dict:
+    """
+    parses the output of the status command into disk usage, newest file
+    and position. Fields that could not be determined are None.
+    """
+    status = {
+        "disk_used_percent": None,
+        "disk_available_kb": None,
+        "newest_file": None,
+        "newest_file_mtime": None,
+        "lat": None,
+        "lon": None,
+    }
+    sections = [section.strip() for section in output.split(STATUS_SEPARATOR)]
+    sections += [""] * (3 - len(sections))
+    try:
+        # Filesystem 1024-blocks Used Available Capacity Mounted on
+        df_fields = sections[0].split()
+        status["disk_available_kb"] = int(df_fields[3])
+        status["disk_used_percent"] = float(df_fields[4].rstrip("%"))
+    except (IndexError, ValueError):
+        pass
+    try:
+        # find -printf '%T@ %f', empty when the data dir holds no files
+        mtime, newest_file = sections[1].split(" ", 1)
+        status["newest_file_mtime"] = float(mtime)
+        status["newest_file"] = newest_file
+    except ValueError:
+        pass
+    try:
+        lat, lon = sections[2].split(",")
+        status["lat"] = float(lat)
+        status["lon"] = float(lon)
+    except ValueError:
+        pass
+    return status
+
+
+def poll_box(serialnumber: str, config: dict) -> dict:
+    """
+    poll_box(serialnumber : str, config : dict) -> dict
+
+    checks whether the box is reachable and collects its status with one
+    additional ssh round trip
+    """
+    status = probe_host(serialnumber, remote=config["remote"], verbose=config["verbose"])
+    if status["reachable"]:
+        if output := ssh_exec(status["access"], assemble_status_cmd(), verbose=config["verbose"]):
+            status.update(parse_status_output(output))
+    return status
+
+
+def poll_fake_box(serialnumber: str, config: dict) -> dict:
+    """
+    stand-in for poll_box: a simulated box drifting around Bremen, which is
+    offline now and then. Produces the same fields as poll_box.
+    """
+    rng = random.Random(f"{serialnumber}{time.time()}")
+    t_poll = time.time()
+    if rng.random() < 0.2:
+        return {"reachable": False, "access": None, "probed": t_poll, "last_seen": None, "latency": 10.0}
+    latency = rng.uniform(0.05, 0.5)
+    return {
+        "reachable": True,
+        "access": f"pi@{serialnumber}.local",
+        "probed": t_poll,
+        "last_seen": t_poll,
+        "latency": latency,
+        "disk_used_percent": float(rng.randint(10, 95)),
+        "disk_available_kb": rng.randint(1, 30) * 1024 * 1024,
+        "newest_file": f"{serialnumber}_{time.strftime('%Y-%m-%dT%H-%M-%S', time.gmtime(t_poll // 300 * 300))}.log",
+        "newest_file_mtime": t_poll - rng.uniform(0, 300),
+        "lat": 53.1 + rng.gauss(0, 0.01),
+        "lon": 8.85 + rng.gauss(0, 0.01),
+    }
+
+
+class FleetStatus:
+    """
+    thread safe store of the latest status of every box. A box that could
+    not be reached keeps its last known position and file information.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status = dict()
+
+    def update(self, serialnumber: str, status: dict):
+        with self._lock:
+            previous = self._status.get(serialnumber, dict())
+            if not status["reachable"]:
+                status = {**previous, **{key: value for key, value in status.items() if key != "last_seen"}}
+                status.setdefault("last_seen", None)
+            self._status[serialnumber] = {"msb": serialnumber, **status}
+
+    def get(self, serialnumber: str = None):
+        with self._lock:
+            if serialnumber:
+                return self._status.get(serialnumber)
+            return dict(self._status)
+
+
+def poll_fleet(config: dict, fleet_status: FleetStatus):
+    """polls all boxes once, at most config['jobs'] at a time"""
+    poll = poll_fake_box if config["fake"] else poll_box
+
+    def poll_update(serialnumber):
+        try:
+            fleet_status.update(serialnumber, poll(serialnumber, config))
+        except Exception as e:
+            print(f"failed to poll {serialnumber}: {e}")
+
+    t_start = time.time()
+    with ThreadPoolExecutor(max_workers=config["jobs"]) as executor:
+        list(executor.map(poll_update, [serialnumber.lower() for serialnumber in config["msb"]]))
+    if config["verbose"]:
+        print(f"polled {len(config['msb'])} boxes in {time.time() - t_start:.1f} s")
+
+
+def run_poller(config: dict, fleet_status: FleetStatus, stop: threading.Event):
+    while not stop.is_set():
+        t_start = time.time()
+        poll_fleet(config, fleet_status)
+        stop.wait(max(0.0, config["interval"] - (time.time() - t_start)))
+
+
+class StatusRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /status returns the status of all boxes, GET /status/<serial> the
+    status of a single box, both as json
+    """
+
+    def do_GET(self):
+        fields = self.path.strip("/").split("/")
+        if fields[0] != "status" or len(fields) > 2:
+            self.send_error(404)
+            return
+        status = self.server.fleet_status.get(fields[1].lower() if len(fields) == 2 else None)
+        if status is None:
+            self.send_error(404, "unknown motion sensor box")
+            return
+        body = json.dumps(status).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def query_status(serialnumber: str = None, port: int = DEFAULT_PORT, timeout: float = 5.0):
+    """
+    query_status(serialnumber : str = None, port : int = DEFAULT_PORT, timeout : float = 5.0)
+
+    returns the status of all boxes, or of a single box, from a running
+    daemon on localhost
+    """
+    url = f"http://127.0.0.1:{port}/status"
+    if serialnumber:
+        url = f"{url}/{serialnumber.lower()}"
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.load(response)
+
+
+def serve_status(config: dict):
+    """
+    serve_status(config : dict)
+
+    polls the fleet every config['interval'] seconds in a background thread
+    and answers status queries from memory until interrupted
+    """
+    fleet_status = FleetStatus()
+    stop = threading.Event()
+    server = ThreadingHTTPServer(("127.0.0.1", config["port"]), StatusRequestHandler)
+    server.fleet_status = fleet_status
+    server.verbose = config["verbose"]
+    poller = threading.Thread(target=run_poller, args=(config, fleet_status, stop), daemon=True)
+    poller.start()
+    if config["verbose"]:
+        print(f"serving status on http://127.0.0.1:{config['port']}/status")
+    try:
+        server.serve_forever()
+    finally:
+        stop.set()
+        server.server_close()
+        poller.join()
+
+
+if __name__ == "__main__":
+    config = parse_cmdline()
+    if config["query"] is not None:
+        print(json.dumps(query_status(config["query"], port=config["port"]), indent=1))
+        sys.exit(0)
+    try:
+        with ssh_sessions():
+            serve_status(config)
+    except KeyboardInterrupt:
+        pass
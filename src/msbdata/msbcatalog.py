@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+
+import argparse
+from datetime import datetime, timezone
+from collections import deque
+from glob import glob
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from msbformats import read_epochs, split_extension, open_compressed, detect_compression, OUTPUT_FORMATS
+from msbpartitions import partition_keys
+from msbtimes import parse_timestamp_strings, parse_generic_timestamp_string, select_time_window, FIXED_TIMESTAMP_FORMATS, NO_EPOCH
+
+# kept in the directory it indexes, next to the manifests
+CATALOG_FILENAME = ".msbcatalog.sqlite"
+
+# begin/end epoch are the first and last sample of a data file. Raw
+# logfiles are only read at their end: the time stamp in the name and the
+# epoch of the last record bound the samples. The mtime is no bound, it is
+# the time of the transfer for fetched files. timestamp is the time stamp
+# in the file name, timestamp_fmt the format it was parsed with.
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    msb TEXT,
+    sensor TEXT,
+    timestamp INTEGER,
+    timestamp_fmt TEXT,
+    begin_epoch REAL,
+    end_epoch REAL,
+    rows INTEGER,
+    size INTEGER,
+    mtime REAL
+);
+CREATE INDEX IF NOT EXISTS files_end_epoch ON files (end_epoch);
+CREATE INDEX IF NOT EXISTS files_msb_end_epoch ON files (msb, end_epoch);
+"""
+# bytes read from the end of an uncompressed logfile to find its last record
+TAIL_SIZE = 64 * 1024
+
+
+def parse_cmdline() -> dict:
+    cmd_parser = argparse.ArgumentParser(
+        description="create or refresh the file catalog of a data directory, or query it for the files of a time window"
+    )
+    cmd_parser.add_argument("dir", type=str, help="data directory")
+    cmd_parser.add_argument("--file-pattern", default="*", type=str, help="files to be cataloged or selected, relative to dir. Default: *")
+    cmd_parser.add_argument("--begin", default=None, type=str, help="select the files containing data from this ISO time stamp on")
+    cmd_parser.add_argument("--end", default=None, type=str, help="select the files containing data up to this ISO time stamp. Default: now")
+    cmd_parser.add_argument("--msb", default=None, type=str, help="select the files of this motion sensor box only")
+    cmd_parser.add_argument("--sensor", default=None, type=str, help="select the files of this sensor only")
+    cmd_parser.add_argument("--verbose", action="store_true")
+    config = cmd_parser.parse_args().__dict__
+    assert os.path.isdir(config["dir"]), f'not a directory: {config["dir"]}'
+    return config
+
+
+def catalog_path(catalog_dir: str) -> str:
+    return os.path.join(catalog_dir, CATALOG_FILENAME)
+
+
+def has_catalog(catalog_dir: str) -> bool:
+    return os.path.isfile(catalog_path(catalog_dir))
+
+
+def find_catalog_dir(file_dir: str) -> str:
+    """
+    returns the directory of the catalog covering file_dir: file_dir itself
+    or, for the sensor subdirectories of an extraction, its parent. None if
+    there is no catalog.
+    """
+    file_dir = os.path.abspath(file_dir)
+    for catalog_dir in (file_dir, os.path.dirname(file_dir)):
+        if has_catalog(catalog_dir):
+            return catalog_dir
+    return None
+
+
+def open_catalog(catalog_dir: str) -> sqlite3.Connection:
+    """opens the catalog of catalog_dir, creating it if there is none yet"""
+    connection = sqlite3.connect(catalog_path(catalog_dir), timeout=30)
+    connection.executescript(CATALOG_SCHEMA)
+    return connection
+
+
+def parse_name_timestamps(fpaths: list, timestamp_fmts: tuple = tuple(FIXED_TIMESTAMP_FORMATS)) -> tuple:
+    """
+    parse_name_timestamps(fpaths : list, timestamp_fmts : tuple = tuple(FIXED_TIMESTAMP_FORMATS)) -> tuple
+
+    parses the time stamps in the file names, trying the formats in turn
+
+        Returns:
+            list of epochs and list of the formats they were parsed with,
+            both None for file names without a valid time stamp
+    """
+    names = [os.path.basename(fpath).split(".")[0].split("_")[-1] for fpath in fpaths]
+    timestamps = [None] * len(names)
+    formats = [None] * len(names)
+    for timestamp_fmt in timestamp_fmts:
+        missing = [i for i, timestamp in enumerate(timestamps) if timestamp is None]
+        if not missing:
+            break
+        epochs = parse_timestamp_strings([names[i] for i in missing], timestamp_fmt)
+        for i, epoch in zip(missing, epochs.tolist()):
+            if epoch != NO_EPOCH:
+                timestamps[i] = epoch
+                formats[i] = timestamp_fmt
+    return timestamps, formats
+
+
+def record_epoch(line: bytes) -> float:
+    """epoch of a logfile record {"<topic>": [epoch, ...]}, None if malformed"""
+    try:
+        return float(next(iter(json.loads(line).values()))[0])
+    except Exception:
+        return None
+
+
+def last_record_epoch(fpath: str) -> float:
+    """
+    last_record_epoch(fpath : str) -> float
+
+    returns the epoch of the last valid record of a raw logfile, or None if
+    there is none. Only the last TAIL_SIZE bytes of uncompressed logfiles
+    are read, compressed ones have to be streamed to their end.
+    """
+    if detect_compression(fpath):
+        with open_compressed(fpath, "rb") as fhandle:
+            lines = deque(fhandle, maxlen=1024)
+    else:
+        with open(fpath, "rb") as fhandle:
+            fhandle.seek(max(0, os.path.getsize(fpath) - TAIL_SIZE))
+            lines = fhandle.read().splitlines()
+    # the first line of the tail and a line still being written are
+    # incomplete, they fail to parse and are skipped
+    for line in reversed(lines):
+        if (epoch := record_epoch(line)) is not None:
+            return epoch
+    return None
+
+
+def catalog_row(catalog_dir: str, fpath: str, stat: os.stat_result, timestamp: int, timestamp_fmt: str) -> tuple:
+    """
+    returns the catalog row of a file. Data files in one of the
+    OUTPUT_FORMATS are read to determine the number of rows and the epochs
+    of the first and last sample. Other files are taken as raw logfiles,
+    which begin at the time stamp in their name and end with their last
+    record (or at their time stamp, if they hold no valid record yet).
+    """
+    msb, sensor = partition_keys(fpath)
+    if split_extension(fpath)[1] in OUTPUT_FORMATS:
+        epochs = read_epochs(fpath)
+        if len(epochs):
+            begin_epoch, end_epoch, rows = float(epochs.min()), float(epochs.max()), len(epochs)
+        else:
+            begin_epoch, end_epoch, rows = None, None, 0
+    else:
+        end_epoch = last_record_epoch(fpath)
+        begin_epoch, end_epoch, rows = timestamp, timestamp if end_epoch is None else end_epoch, None
+    return (
+        os.path.relpath(fpath, catalog_dir), msb, sensor, timestamp, timestamp_fmt,
+        begin_epoch, end_epoch, rows, stat.st_size, stat.st_mtime,
+    )
+
+
+def update_catalog(catalog_dir: str, fpaths: list, verbose: bool = False) -> int:
+    """
+    update_catalog(catalog_dir : str, fpaths : list, verbose : bool = False) -> int
+
+    adds the given files below catalog_dir to its catalog. Files whose size
+    and mtime match their catalog entry are skipped, all others are
+    (re)read. Files that no longer exist are removed from the catalog.
+
+        Returns:
+            number of catalog entries added or updated
+    """
+    rel_fpaths = [os.path.relpath(fpath, catalog_dir) for fpath in fpaths]
+    with open_catalog(catalog_dir) as connection:
+        cataloged = dict()
+        # in chunks, sqlite limits the number of query parameters
+        for i in range(0, len(rel_fpaths), 500):
+            chunk = rel_fpaths[i:i + 500]
+            cataloged.update(
+                (path, (size, mtime))
+                for path, size, mtime in connection.execute(
+                    f"SELECT path, size, mtime FROM files WHERE path IN ({','.join('?' * len(chunk))})", chunk
+                )
+            )
+        changed, stats, removed = list(), list(), list()
+        for fpath, rel_fpath in zip(fpaths, rel_fpaths):
+            try:
+                stat = os.stat(fpath)
+            except FileNotFoundError:
+                removed.append((rel_fpath,))
+                continue
+            if cataloged.get(rel_fpath) != (stat.st_size, stat.st_mtime):
+                changed.append(os.path.join(catalog_dir, rel_fpath))
+                stats.append(stat)
+        rows = list()
+        for fpath, stat, timestamp, timestamp_fmt in zip(changed, stats, *parse_name_timestamps(changed)):
+            try:
+                rows.append(catalog_row(catalog_dir, fpath, stat, timestamp, timestamp_fmt))
+            except Exception as e:
+                print(f"failed to catalog {fpath}: {e}")
+                continue
+            if verbose:
+                print(f"cataloged {fpath}")
+        connection.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        connection.executemany("DELETE FROM files WHERE path = ?", removed)
+    connection.close()
+    return len(rows)
+
+
+def refresh_catalog(catalog_dir: str, file_pattern: str = "*", verbose: bool = False) -> int:
+    """
+    refresh_catalog(catalog_dir : str, file_pattern : str = "*", verbose : bool = False) -> int
+
+    brings the catalog in line with the files matching file_pattern below
+    catalog_dir, e.g. after files have been added by other tools
+    """
+    fpaths = [
+        fpath for fpath in glob(os.path.join(catalog_dir, file_pattern), recursive=True)
+        if os.path.isfile(fpath) and not os.path.basename(fpath).startswith((".", "_"))
+    ]
+    updated = update_catalog(catalog_dir, fpaths, verbose=verbose)
+    # entries of deleted files, which the glob did not return
+    with open_catalog(catalog_dir) as connection:
+        vanished = [
+            (path,) for (path,) in connection.execute("SELECT path FROM files")
+            if not os.path.isfile(os.path.join(catalog_dir, path))
+        ]
+        connection.executemany("DELETE FROM files WHERE path = ?", vanished)
+    connection.close()
+    return updated
+
+
+def select_catalog_files(
+    catalog_dir: str,
+    begin: float,
+    end: float,
+    file_pattern: str = "*",
+    msb: str = None,
+    sensor: str = None,
+) -> list:
+    """
+    select_catalog_files(catalog_dir : str, begin : float, end : float, file_pattern : str = "*", msb : str = None, sensor : str = None) -> list
+
+    returns the sorted paths of all cataloged files in catalog_dir matching
+    file_pattern that contain data between the epochs begin and end,
+    optionally restricted to one msb and/or sensor. The lookup uses the
+    index on the end epoch, so it only touches the files ending after begin.
+
+        Returns:
+            list of file paths, or None if no catalog covers catalog_dir
+    """
+    file_dir = os.path.abspath(catalog_dir)
+    if not (catalog_dir := find_catalog_dir(file_dir)):
+        return None
+    if file_dir != catalog_dir:
+        file_pattern = os.path.join(os.path.relpath(file_dir, catalog_dir), file_pattern)
+    # the unary + keeps sqlite from scanning the path index for the pattern.
+    # * also matches / in sqlite GLOB, so files in subdirectories of
+    # catalog_dir are excluded explicitly
+    query = "SELECT path FROM files WHERE end_epoch >= ? AND begin_epoch <= ? AND +path GLOB ? AND +path NOT GLOB ?"
+    parameters = [begin, end, file_pattern, os.path.join(os.path.dirname(file_pattern), "*", "*")]
+    if msb:
+        query += " AND msb = ?"
+        parameters.append(msb)
+    if sensor:
+        query += " AND sensor = ?"
+        parameters.append(sensor)
+    with open_catalog(catalog_dir) as connection:
+        paths = [path for (path,) in connection.execute(query, parameters)]
+    connection.close()
+    return sorted(os.path.join(catalog_dir, path) for path in paths)
+
+
+def catalog_timestamps(fpaths: list, timestamp_fmt: str) -> list:
+    """
+    catalog_timestamps(fpaths : list, timestamp_fmt : str) -> list
+
+    looks up the file name time stamps of the given files in the catalogs
+    of their directories, if they have been parsed with timestamp_fmt
+
+        Returns:
+            list of epochs, None for files not found in a catalog
+    """
+    timestamps = [None] * len(fpaths)
+    by_dir = dict()
+    for i, fpath in enumerate(fpaths):
+        by_dir.setdefault(os.path.dirname(os.path.abspath(fpath)), list()).append(i)
+    catalogs = dict()
+    for file_dir, indices in by_dir.items():
+        if not (catalog_dir := find_catalog_dir(file_dir)):
+            continue
+        if catalog_dir not in catalogs:
+            with open_catalog(catalog_dir) as connection:
+                catalogs[catalog_dir] = dict(
+                    connection.execute("SELECT path, timestamp FROM files WHERE timestamp_fmt = ?", (timestamp_fmt,))
+                )
+            connection.close()
+        for i in indices:
+            timestamps[i] = catalogs[catalog_dir].get(os.path.relpath(os.path.abspath(fpaths[i]), catalog_dir))
+    return timestamps
+
+
+def find_time_files(
+    file_dir: str,
+    file_pattern: str = "*",
+    begin: datetime = datetime.fromisoformat("1970-01-01T00:00:00+00:00"),
+    end: datetime = None,
+    timestamp_fmt: str = "%Y-%m-%dT%H:%M:%S%z",
+) -> list:
+    """
+    find_time_files(file_dir : str, file_pattern : str = "*", begin : datetime = 1970-01-01, end : datetime = None, timestamp_fmt : str = "%Y-%m-%dT%H:%M:%S%z") -> list
+
+    returns the sorted files in file_dir matching file_pattern with data
+    between begin and end (default: now). Uses the catalog of file_dir if
+    there is one, otherwise selects the files by the time stamp in their
+    name, see select_time_window.
+    """
+    end = end or datetime.fromtimestamp(time.time(), timezone.utc)
+    if (files := select_catalog_files(file_dir, begin.timestamp(), end.timestamp(), file_pattern)) is not None:
+        return files
+    return select_time_window(glob(os.path.join(file_dir, file_pattern)), begin.timestamp(), end.timestamp(), timestamp_fmt)
+
+
+if __name__ == "__main__":
+    config = parse_cmdline()
+    if config["begin"] is None:
+        t_start = time.time()
+        updated = refresh_catalog(config["dir"], config["file_pattern"], verbose=config["verbose"])
+        print(f'{updated} files cataloged in {time.time() - t_start:.1f} s')
+        sys.exit(0)
+    begin = parse_generic_timestamp_string(config["begin"]).timestamp()
+    end = parse_generic_timestamp_string(config["end"]).timestamp() if config["end"] else time.time()
+    files = select_catalog_files(config["dir"], begin, end, config["file_pattern"], msb=config["msb"], sensor=config["sensor"])
+    if files is None:
+        print(f'no catalog in {config["dir"]}, please create it first')
+        sys.exit(1)
+    for fpath in files:
+        print(fpath)
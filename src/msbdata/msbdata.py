@@ -1,8 +1,21 @@
-from datetime import datetime
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timezone
+import heapq
+import io
 import json
+import mmap
+import numpy as np
 import os
+import pandas as pd
+import shutil
+import time
+import warnings
 
-from msbtimes import parse_fmt_timestamp_string
+from msbformats import to_dataframe, write_dataframe, read_data_file, open_compressed, split_extension, seek_forward
+from msbcatalog import catalog_timestamps
+from msbtimes import parse_fmt_timestamp_string, parse_timestamp_strings, NO_EPOCH
 from config import MSB_REMOTE_DATA_DIR, MSB_LOCAL_DATA_DIR
 from ssh import ssh_exec
 
@@ -21,6 +34,29 @@ def fetch_remote_datafile_paths(
     ):
         yield fpath
 
+def fetch_remote_datafile_stats(
+    serialnumber: str, ssh_remote_host: str, begin: float = None, verbose: bool = False
+) -> iter:
+    """
+    fetch_remote_datafile_stats(serialnumber : str, ssh_remote_host : str, begin : float = None, verbose : bool = False) -> iter
+
+    like fetch_remote_datafile_paths, but yields (path, size, mtime) tuples
+    of the remote data files, listed with a single find. If begin (unix
+    epoch) is given, the box only lists files modified since then. A file
+    is written after the time stamp in its name, so no file with a time
+    stamp >= begin is left out.
+    """
+    newer = f"-newermt @{int(begin)}" if begin else ""
+    listing = ssh_exec(
+        ssh_remote_host,
+        # the inner single quotes protect the escapes from the remote shell
+        f"find {MSB_REMOTE_DATA_DIR} -iname \"'*{serialnumber}*'\" -type f {newer} -printf \"'%p\\t%s\\t%T@\\n'\" | sort",
+        verbose=verbose,
+    )
+    for line in (listing or "").splitlines():
+        fpath, size, mtime = line.rsplit("\t", 2)
+        yield (fpath, int(size), float(mtime))
+
 def extract_timestamp_fpath(
     fpath: str,
     timestamp_field=-1,
@@ -32,6 +68,26 @@ def extract_timestamp_fpath(
     if timestamp := parse_fmt_timestamp_string(timestamp_string, timestamp_fmt):
         return timestamp
 
+def extract_epochs_fpaths(
+    fpaths: list,
+    timestamp_field=-1,
+    field_sep="_",
+    timestamp_fmt: str = "%Y%m%dT%H%M%S%z",
+) -> np.ndarray:
+    """
+    extract_epochs_fpaths(fpaths : list, timestamp_field=-1, field_sep="_", timestamp_fmt : str = "%Y%m%dT%H%M%S%z") -> np.ndarray
+
+    like extract_timestamp_fpath, but parses the time stamps of all paths
+    in one call of parse_timestamp_strings
+
+        Returns:
+            int64 array of unix epochs, NO_EPOCH for paths without a valid time stamp
+    """
+    return parse_timestamp_strings(
+        [fpath.split(".")[0].split(field_sep)[timestamp_field] for fpath in fpaths],
+        timestamp_fmt,
+    )
+
 def extract_timestamp_fpaths(
     fpaths: iter,
     timestamp_field: int = -1,
@@ -50,20 +106,28 @@ def extract_timestamp_fpaths(
     timestamp_fmt   Format of the timestamp in the file name
     """
 
-    for fpath in fpaths:
+    fpaths = list(fpaths)
+    # time stamps of cataloged files are not parsed again. The catalog holds
+    # the time stamp after the last "_" of the file name
+    epochs = np.full(len(fpaths), NO_EPOCH, dtype=np.int64)
+    if timestamp_field == -1 and field_sep == "_":
+        epochs[:] = [NO_EPOCH if timestamp is None else timestamp for timestamp in catalog_timestamps(fpaths, timestamp_fmt)]
+    if uncataloged := np.flatnonzero(epochs == NO_EPOCH).tolist():
+        epochs[uncataloged] = extract_epochs_fpaths(
+            [fpaths[i] for i in uncataloged],
+            timestamp_field=timestamp_field,
+            field_sep=field_sep,
+            timestamp_fmt=timestamp_fmt,
+        )
+    for epoch, fpath in zip(epochs.tolist(), fpaths):
         print(fpath)
         yield (
-            extract_timestamp_fpath(
-                fpath=fpath,
-                timestamp_field=timestamp_field,
-                field_sep=field_sep,
-                timestamp_fmt=timestamp_fmt,
-            ),
+            None if epoch == NO_EPOCH else datetime.fromtimestamp(epoch, timezone.utc),
             fpath,
         )
 
 def read_parse_msblogfile(logfile: str, verbose: bool = False) -> iter:
-    with open(logfile, "r") as logfile_fhandle:
+    with open_compressed(logfile, "rt") as logfile_fhandle:
         for line in logfile_fhandle:
             try:
                 data = json.loads(line.rstrip())
@@ -75,85 +139,671 @@ def read_parse_msblogfile(logfile: str, verbose: bool = False) -> iter:
                 print(f"{data}")
             yield data
 
-def get_output_filepath(output_dir, logfile_name, output_filename_prefix):
-    output_filename = f"{output_filename_prefix}_{logfile_name}.csv"
+
+class LogfileCursor:
+    """
+    iterates over the decoded samples of a logfile starting at a byte offset.
+    Only complete lines, i.e. lines terminated by a newline, are consumed. A
+    partially written trailing line is left for the next pass. After
+    iterating, offset points to the first byte that has not been processed.
+    """
+
+    def __init__(self, logfile: str, offset: int = 0, verbose: bool = False):
+        self.logfile = logfile
+        self.offset = offset
+        self.verbose = verbose
+        self.bad_lines = 0
+
+    def __iter__(self):
+        with open_compressed(self.logfile, "rb") as logfile_fhandle:
+            seek_forward(logfile_fhandle, self.offset)
+            for line in logfile_fhandle:
+                if not line.endswith(b"\n"):
+                    break
+                self.offset += len(line)
+                try:
+                    data = json.loads(line)
+                except Exception as e:
+                    self.bad_lines += 1
+                    if self.verbose:
+                        print(f"failed to parse line: {line} {e} skipping")
+                    continue
+                yield data
+
+GPS_FIELDS = ("time", "lat", "lon", "alt")
+
+
+class TopicArray:
+    """
+    preallocated, growable 2D array collecting the samples of a single topic.
+    The capacity is doubled whenever it is exhausted, so appending n rows
+    costs O(n) amortized copies.
+    """
+
+    def __init__(self, width: int, dtype=np.float64, capacity: int = 65536):
+        self.width = width
+        self.size = 0
+        self._data = np.empty((capacity, width), dtype=dtype)
+
+    def append(self, rows: np.ndarray):
+        required = self.size + len(rows)
+        if required > len(self._data):
+            capacity = max(required, 2 * len(self._data))
+            grown = np.empty((capacity, self.width), dtype=self._data.dtype)
+            grown[: self.size] = self._data[: self.size]
+            self._data = grown
+        self._data[self.size : required] = rows
+        self.size = required
+
+    def to_array(self) -> np.ndarray:
+        return self._data[: self.size]
+
+
+class LogfileFollower:
+    """
+    follows a logfile that is still being written, similar to tail -f. The
+    file is kept open and polled every poll_interval seconds for appended
+    lines. A partially written trailing line is kept until it is completed.
+    Whenever all available lines have been consumed, None is yielded once,
+    so consumers can flush their buffers. Iteration ends when next_logfile()
+    returns a newer logfile, after the remaining lines have been drained.
+    """
+
+    def __init__(
+        self,
+        logfile: str,
+        next_logfile=lambda: None,
+        poll_interval: float = 1.0,
+        verbose: bool = False,
+    ):
+        self.logfile = logfile
+        self.next_logfile = next_logfile
+        self.poll_interval = poll_interval
+        self.verbose = verbose
+        self.bad_lines = 0
+
+    def _decode(self, line: bytes):
+        try:
+            return json.loads(line)
+        except Exception as e:
+            self.bad_lines += 1
+            if self.verbose:
+                print(f"failed to parse line: {line} {e} skipping")
+            return None
+
+    def __iter__(self):
+        partial = b""
+        with open(self.logfile, "rb") as logfile_fhandle:
+            while True:
+                idle = True
+                while line := logfile_fhandle.readline():
+                    if not line.endswith(b"\n"):
+                        partial += line
+                        break
+                    idle = False
+                    if (data := self._decode(partial + line)) is not None:
+                        yield data
+                    partial = b""
+                if not idle:
+                    yield None
+                if successor := self.next_logfile():
+                    # the logfile has been rotated, drain what has been written
+                    # in between and treat a trailing line as complete
+                    partial += logfile_fhandle.read()
+                    for line in partial.splitlines():
+                        if (data := self._decode(line)) is not None:
+                            yield data
+                    if self.verbose:
+                        print(f"rolling over from {self.logfile} to {successor}")
+                    return
+                time.sleep(self.poll_interval)
+
+
+# lookup table of the characters that cannot occur in a payload field
+# written as an integer, e.g. the ones in 1.5, 1e-3 or NaN
+NON_INTEGER_CHARS = np.ones(256, dtype=bool)
+NON_INTEGER_CHARS[np.frombuffer(b"0123456789-+, ", dtype=np.uint8)] = False
+
+
+def _parse_numeric_block(payloads: list, width: int) -> tuple:
+    """
+    converts a list of comma separated payloads of equal width into a
+    (len(payloads), width) float64 array with a single call into numpy.
+    Raises ValueError if any payload contains non-numeric data.
+
+        Returns:
+            tuple (values, integral), where integral is a boolean array of
+            the same shape marking the values written as integers, so they
+            can be written back as integers
+    """
+    text = ",".join(payloads)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        values = np.fromstring(text, sep=",")
+    if values.size != len(payloads) * width:
+        raise ValueError("payload width mismatch")
+    chars = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+    commas = np.flatnonzero(chars == ord(","))
+    integral = np.ones(values.size, dtype=bool)
+    integral[np.searchsorted(commas, np.flatnonzero(NON_INTEGER_CHARS[chars]))] = False
+    return (values.reshape(len(payloads), width), integral.reshape(len(payloads), width))
+
+
+def _decode_blocks_columnar(blocks: iter, verbose: bool = False) -> tuple:
+    """
+    decodes an iterator over blocks (lists) of lines into per-topic arrays,
+    see read_parse_msblogfile_columnar
+    """
+    arrays = dict()
+    integral_arrays = dict()
+    gps_rows = list()
+    bad_lines = 0
+
+    def flush_numeric(topic: str, payloads: list):
+        nonlocal bad_lines
+        if not payloads:
+            return
+        if topic not in arrays:
+            arrays[topic] = TopicArray(payloads[0].count(",") + 1)
+            integral_arrays[topic] = TopicArray(arrays[topic].width, dtype=bool)
+        try:
+            values, integral = _parse_numeric_block(payloads, arrays[topic].width)
+            arrays[topic].append(values)
+            integral_arrays[topic].append(integral)
+            return
+        except ValueError:
+            if len(payloads) == 1:
+                bad_lines += 1
+                if verbose:
+                    print(f"failed to parse payload: {payloads[0]} skipping")
+                return
+        # bisect the block to isolate the offending lines while keeping
+        # the order of the samples
+        half = len(payloads) // 2
+        flush_numeric(topic, payloads[:half])
+        flush_numeric(topic, payloads[half:])
+
+    prefixes = {topic: f'{{"{topic}": [' for topic in ("imu", "att")}
+    for block in blocks:
+        payloads = {"imu": list(), "att": list()}
+        for line in block:
+            # fast path: dispatch on the serialized key and keep the
+            # payload as text, it is converted for the whole block at once
+            for topic, prefix in prefixes.items():
+                if line.startswith(prefix) and line.endswith("]}\n"):
+                    payloads[topic].append(line[len(prefix) : -3])
+                    break
+            else:
+                try:
+                    data = json.loads(line)
+                    if "gps" in data:
+                        gps_rows.append(gps_row(data["gps"]))
+                    elif topic := next((t for t in payloads if t in data), None):
+                        payloads[topic].append(",".join(map(str, data[topic])))
+                    elif verbose:
+                        print(f"unknown topic in data: {data}")
+                except Exception as e:
+                    bad_lines += 1
+                    if verbose:
+                        print(f"failed to parse line: {line} {e} skipping")
+        for topic in payloads:
+            flush_numeric(topic, payloads[topic])
+
+    data = {topic: array.to_array() for topic, array in arrays.items()}
+    integral = {topic: array.to_array() for topic, array in integral_arrays.items()}
+    if gps_rows:
+        data["gps"] = np.array(gps_rows, dtype=object)
+    return (data, integral, bad_lines)
+
+
+def read_parse_msblogfile_columnar(
+    logfile: str, block_lines: int = 65536, verbose: bool = False
+) -> tuple:
+    """
+    read_parse_msblogfile_columnar(logfile : str, block_lines : int = 65536, verbose : bool = False) -> tuple
+
+    bulk decoder for msb logfiles. The logfile is read in blocks of about
+    block_lines lines. Every line is dispatched on its topic key without
+    decoding the json object, and the numeric payloads of a whole block are
+    converted at once into preallocated numpy arrays per topic. Only gps
+    samples, which carry a nested object, are decoded via json.
+
+        Parameters:
+            logfile: path to the msb logfile
+            block_lines: number of lines read and converted at once
+            verbose: debugging flag
+
+        Returns:
+            tuple (data, integral, bad_lines), where data is a dict mapping
+            the topics "imu", "att" (float64 arrays) and "gps" (object array
+            with the columns epoch, uptime, time, lat, lon, alt) to 2D
+            arrays, integral maps "imu" and "att" to boolean arrays marking
+            the values that were written as integers in the logfile, and
+            bad_lines is the number of lines that could not be parsed
+    """
+    with open_compressed(logfile, "rt") as logfile_fhandle:
+        return _decode_blocks_columnar(
+            iter(lambda: logfile_fhandle.readlines(block_lines * 128), []),
+            verbose=verbose,
+        )
+
+
+def iter_parse_msblogfile_columnar(
+    logfile: str, block_lines: int = 65536, verbose: bool = False
+) -> iter:
+    """
+    iter_parse_msblogfile_columnar(logfile : str, block_lines : int = 65536, verbose : bool = False) -> iter
+
+    streaming variant of read_parse_msblogfile_columnar: yields one
+    (data, integral, bad_lines) tuple per block of about block_lines lines,
+    so only one block is held in memory at a time
+    """
+    with open_compressed(logfile, "rt") as logfile_fhandle:
+        for block in iter(lambda: logfile_fhandle.readlines(block_lines * 128), []):
+            yield _decode_blocks_columnar([block], verbose=verbose)
+
+
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def split_logfile(logfile: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> list:
+    """
+    split_logfile(logfile : str, chunk_size : int = DEFAULT_CHUNK_SIZE) -> list
+
+    splits a logfile into byte ranges of about chunk_size bytes. Every range
+    ends right after a newline (or at the end of the file), so no line is
+    split between two ranges.
+
+        Returns:
+            list of (begin, end) tuples covering the whole file in order
+    """
+    size = os.path.getsize(logfile)
+    if size == 0:
+        return list()
+    ranges = list()
+    with open(logfile, "rb") as logfile_fhandle, mmap.mmap(
+        logfile_fhandle.fileno(), 0, access=mmap.ACCESS_READ
+    ) as logfile_mmap:
+        begin = 0
+        while begin < size:
+            newline = logfile_mmap.find(b"\n", min(begin + chunk_size, size) - 1)
+            end = size if newline < 0 else newline + 1
+            ranges.append((begin, end))
+            begin = end
+    return ranges
+
+
+def read_parse_msblogfile_range(
+    logfile: str, begin: int, end: int, block_lines: int = 65536, verbose: bool = False
+) -> tuple:
+    """
+    read_parse_msblogfile_range(logfile : str, begin : int, end : int, block_lines : int = 65536, verbose : bool = False) -> tuple
+
+    same as read_parse_msblogfile_columnar, but only decodes the byte range
+    [begin, end) of the memory mapped logfile. Only one block of about
+    block_lines lines is held in memory as text at a time.
+    """
+    block_size = block_lines * 128
+
+    def gen_blocks(logfile_mmap):
+        position = begin
+        while position < end:
+            newline = logfile_mmap.find(b"\n", min(position + block_size, end) - 1, end)
+            block_end = end if newline < 0 else newline + 1
+            yield logfile_mmap[position:block_end].decode("utf-8", errors="replace").splitlines(keepends=True)
+            position = block_end
+
+    with open(logfile, "rb") as logfile_fhandle, mmap.mmap(
+        logfile_fhandle.fileno(), 0, access=mmap.ACCESS_READ
+    ) as logfile_mmap:
+        return _decode_blocks_columnar(gen_blocks(logfile_mmap), verbose=verbose)
+
+
+def read_parse_msblogfile_parallel(
+    logfile: str,
+    jobs: int,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    verbose: bool = False,
+) -> iter:
+    """
+    read_parse_msblogfile_parallel(logfile : str, jobs : int, chunk_size : int = DEFAULT_CHUNK_SIZE, verbose : bool = False) -> iter
+
+    decodes a large logfile with a pool of jobs worker processes. The file
+    is split into newline aligned ranges of about chunk_size bytes, which
+    the workers memory map and decode independently. At most 2 * jobs
+    ranges are in flight, so the memory use does not depend on the size of
+    the logfile.
+
+        Returns:
+            iterator over (data, integral, bad_lines) tuples, one per range,
+            in the order of the ranges in the logfile
+    """
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for begin, end in split_logfile(logfile, chunk_size):
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().result()
+            pending.append(
+                executor.submit(
+                    read_parse_msblogfile_range, logfile, begin, end, verbose=verbose
+                )
+            )
+        while pending:
+            yield pending.popleft().result()
+
+
+def merge_columnar(results: iter) -> tuple:
+    """
+    merge_columnar(results : iter) -> tuple
+
+    concatenates the per-range (data, integral, bad_lines) tuples returned
+    by read_parse_msblogfile_parallel into a single such tuple
+    """
+    arrays = dict()
+    integral_arrays = dict()
+    bad_lines = 0
+    for data, integral, range_bad_lines in results:
+        bad_lines += range_bad_lines
+        for topic, array in data.items():
+            arrays.setdefault(topic, list()).append(array)
+        for topic, array in integral.items():
+            integral_arrays.setdefault(topic, list()).append(array)
+    return (
+        {topic: np.concatenate(parts) for topic, parts in arrays.items()},
+        {topic: np.concatenate(parts) for topic, parts in integral_arrays.items()},
+        bad_lines,
+    )
+
+def get_output_filepath(output_dir, logfile_name, output_filename_prefix, extension="csv"):
+    output_filename = f"{output_filename_prefix}_{logfile_name}.{extension}"
     output_fulldir = os.path.join(output_dir, output_filename_prefix)
     os.makedirs(output_fulldir, exist_ok=True)
     return os.path.join(output_fulldir, output_filename)
 
+# column layouts of the payloads by topic and number of fields. The imu
+# layout is the one of the samples in tests/csv_testfiles/imu, gps rows are
+# flattened by gps_row. There is no documented layout of att payloads.
+IMU_COLUMNS = (
+    "epoch",
+    "acc_x",
+    "acc_y",
+    "acc_z",
+    "rot_x",
+    "rot_y",
+    "rot_z",
+    "mag_x",
+    "mag_y",
+    "mag_z",
+    "temp",
+)
+GPS_COLUMNS = ("epoch", "uptime") + GPS_FIELDS
+TOPIC_LAYOUTS = {
+    "imu": {len(IMU_COLUMNS): IMU_COLUMNS},
+    "gps": {len(GPS_COLUMNS): GPS_COLUMNS},
+}
+DEFAULT_FLUSH_SIZE = 8192
+# block size of buffered copies when concatenating compressed files
+COPY_BUFSIZE = 1024 * 1024
+
+
+def topic_columns(topic: str, width: int) -> tuple:
+    """
+    returns the column names of a topic with the given number of fields.
+    For payloads without a known layout no names are guessed: the first
+    column is the epoch, all other columns are numbered by their position.
+    """
+    if columns := TOPIC_LAYOUTS.get(topic, dict()).get(width):
+        return columns
+    return ("epoch",) + tuple(f"{topic}_{i}" for i in range(1, width))
+
+
+def format_csv_chunk(rows: np.ndarray, integral: np.ndarray = None) -> str:
+    """
+    format_csv_chunk(rows : np.ndarray, integral : np.ndarray = None) -> str
+
+    formats a 2D array of samples into csv lines with a single string
+    formatting call over the whole chunk. Values are formatted like str()
+    of the json decoded samples, i.e. floats in their shortest round trip
+    representation and the values marked in integral as integers.
+    """
+    if integral is not None and integral.any():
+        rows = rows.astype(object)
+        rows[integral] = rows[integral].astype(np.int64)
+    n_rows, width = rows.shape
+    return ((",".join(["%s"] * width) + "\n") * n_rows) % tuple(rows.ravel().tolist())
+
+
+class TopicWriter:
+    """
+    collects the samples of a single topic and writes them to a csv file in
+    chunks of flush_size rows. Single rows are buffered in a list, arrays
+    of samples are buffered as they are and formatted as a whole by
+    format_csv_chunk. Each chunk is written with a single call. The file is
+    only created once the first chunk is flushed, so topics missing in a
+    logfile do not leave empty files behind. With append set, rows are
+    appended to an existing file and the header is only written if the
+    file is empty. Output files with a .gz, .xz or .zst extension are
+    compressed on the fly.
+    """
+
+    def __init__(
+        self,
+        output_filepath: str,
+        topic: str,
+        flush_size: int = DEFAULT_FLUSH_SIZE,
+        append: bool = False,
+    ):
+        self.output_filepath = output_filepath
+        self.topic = topic
+        self.flush_size = flush_size
+        self.append_mode = append
+        self.width = None
+        self._rows = list()
+        self._chunks = list()
+        self._pending = 0
+        self._fhandle = None
+
+    def append(self, row: list):
+        if self.width is None:
+            self.width = len(row)
+        self._rows.append(row)
+        self._pending += 1
+        if self._pending >= self.flush_size:
+            self.flush()
+
+    def extend(self, rows, integral: np.ndarray = None):
+        if not isinstance(rows, np.ndarray):
+            for row in rows:
+                self.append(row)
+            return
+        if not len(rows):
+            return
+        if self.width is None:
+            self.width = rows.shape[1]
+        if self._rows:
+            # keep the order of rows appended in between
+            self._chunks.append(self._format_rows())
+        self._chunks.append(format_csv_chunk(rows, integral))
+        self._pending += len(rows)
+        if self._pending >= self.flush_size:
+            self.flush()
+
+    def _format_rows(self) -> str:
+        text = "".join([",".join(map(str, row)) + "\n" for row in self._rows])
+        self._rows = list()
+        return text
+
+    def flush(self):
+        if not self._pending:
+            return
+        if not self._fhandle:
+            write_header = not (
+                self.append_mode
+                and os.path.isfile(self.output_filepath)
+                and os.path.getsize(self.output_filepath) > 0
+            )
+            self._fhandle = open_compressed(
+                self.output_filepath, "at" if self.append_mode else "wt"
+            )
+            if write_header:
+                self._fhandle.write(",".join(topic_columns(self.topic, self.width)) + "\n")
+        if self._rows:
+            self._chunks.append(self._format_rows())
+        self._fhandle.write("".join(self._chunks))
+        self._fhandle.flush()
+        self._chunks = list()
+        self._pending = 0
+
+    def close(self):
+        self.flush()
+        if self._fhandle:
+            self._fhandle.close()
+            self._fhandle = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def gps_row(gps_data: list) -> list:
+    """
+    flattens a gps sample [epoch, uptime, {time, lat, lon, alt}] into a row.
+    Missing fields are set to 0.
+    """
+    epoch, uptime, data = gps_data
+    return [epoch, uptime] + [data.get(param, 0) for param in GPS_FIELDS]
+
+
 def decompose_logfile_stream(
-    data_iter: iter, logfile_name: str, output_dir: str, verbose: bool = False
+    data_iter: iter,
+    logfile_name: str,
+    output_dir: str,
+    verbose: bool = False,
+    flush_size: int = DEFAULT_FLUSH_SIZE,
+    append: bool = False,
+    compression: str = None,
 ):
-    global imu_filehandle
-    imu_filehandle = None
-    global gps_filehandle
-    gps_filehandle = None
-    global att_filehandle
-    att_filehandle = None
-
-    def create_append_imu_file(imu_data: list):
-        global imu_filehandle
-        if not imu_filehandle:
-            imu_filehandle = open(
-                get_output_filepath(output_dir, logfile_name, "imu"), "w"
-            )
-        imu_filehandle.writelines(",".join(map(str, imu_data)) + "\n")
+    writers = dict()
+    extension = f"csv.{compression}" if compression else "csv"
 
-    def create_append_att_file(att_data: list):
-        global att_filehandle
-        if not att_filehandle:
-            att_filehandle = open(
-                get_output_filepath(output_dir, logfile_name, "att"), "w"
+    def get_writer(topic: str) -> TopicWriter:
+        if topic not in writers:
+            writers[topic] = TopicWriter(
+                get_output_filepath(output_dir, logfile_name, topic, extension=extension),
+                topic,
+                flush_size=flush_size,
+                append=append,
             )
-        att_filehandle.writelines(",".join(map(str, att_data)) + "\n")
+        return writers[topic]
 
-    def create_append_gps_file(gps_data: list):
-        global gps_filehandle
-        if not gps_filehandle:
-            gps_filehandle = open(
-                get_output_filepath(output_dir, logfile_name, "gps"), "w"
-            )
-        epoch, uptime, data = gps_data
-        for param in ["lat", "lon", "alt", "time"]:
-            if not param in data:
-                data[param] = 0
-        gps_filehandle.writelines(
-            ",".join(
-                map(
-                    str,
-                    (
-                        epoch,
-                        uptime,
-                        data["time"],
-                        data["lat"],
-                        data["lon"],
-                        data["alt"],
-                    ),
-                )
-            )
-            + "\n"
+    try:
+        for data in data_iter:
+            if data is None:
+                # heartbeat of an idle stream, make buffered rows visible
+                for writer in writers.values():
+                    writer.flush()
+            elif "imu" in data:
+                if verbose:
+                    print(f'imu: {data["imu"]}')
+                get_writer("imu").append(data["imu"])
+            elif "gps" in data:
+                if verbose:
+                    print(f'gps: {data["gps"]}')
+                get_writer("gps").append(gps_row(data["gps"]))
+            elif "att" in data:
+                if verbose:
+                    print(f'att: {data["att"]}')
+                get_writer("att").append(data["att"])
+            else:
+                if verbose:
+                    print(f"unknown topic in data: {data}")
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+def decompose_logfile_columnar(
+    data: dict,
+    logfile_name: str,
+    output_dir: str,
+    output_format: str = "parquet",
+    verbose: bool = False,
+    integral: dict = None,
+):
+    """
+    decompose_logfile_columnar(data : dict, logfile_name : str, output_dir : str, output_format : str = "parquet", verbose : bool = False, integral : dict = None)
+
+    writes the per-topic arrays returned by read_parse_msblogfile_columnar
+    into one typed file per topic, using the same directory layout and
+    column names as decompose_logfile_stream.
+
+        Parameters:
+            data: dict mapping topics to 2D arrays of samples
+            logfile_name: name of the logfile, used to name the output files
+            output_dir: output directory
+            output_format: one of msbformats.OUTPUT_FORMATS
+            verbose: debugging flag
+            integral: dict mapping topics to boolean arrays marking the
+                integer values, columns of integers only are stored as int64
+    """
+    integral = integral or dict()
+    for topic, array in data.items():
+        if not len(array):
+            continue
+        output_filepath = get_output_filepath(
+            output_dir, logfile_name, topic, extension=output_format
         )
+        if verbose:
+            print(f"writing {len(array)} {topic} samples to {output_filepath}")
+        columns = topic_columns(topic, array.shape[1])
+        dataframe = to_dataframe(array, columns)
+        if topic in integral:
+            for column, is_integral in zip(columns, integral[topic].all(axis=0)):
+                if is_integral:
+                    dataframe[column] = dataframe[column].astype(np.int64)
+        write_dataframe(dataframe, output_filepath, output_format)
 
-    for data in data_iter:
-        if "imu" in data:
-            if verbose:
-                print(f'imu: {data["imu"]}')
-            create_append_imu_file(data["imu"])
-        elif "gps" in data:
-            if verbose:
-                print(f'gps: {data["gps"]}')
-            create_append_gps_file(data["gps"])
-        elif "att" in data:
-            if verbose:
-                print(f'att: {data["att"]}')
-            create_append_att_file(data["att"])
-        else:
-            if verbose:
-                print(f"unknown topic in data: {data}")
+def decompose_columnar_stream(
+    results: iter,
+    logfile_name: str,
+    output_dir: str,
+    flush_size: int = DEFAULT_FLUSH_SIZE,
+    verbose: bool = False,
+    compression: str = None,
+) -> int:
+    """
+    decompose_columnar_stream(results : iter, logfile_name : str, output_dir : str, flush_size : int = DEFAULT_FLUSH_SIZE, verbose : bool = False, compression : str = None) -> int
 
-    for fhandle in [imu_filehandle, att_filehandle, gps_filehandle]:
-        if fhandle:
-            fhandle.close()
+    writes the (data, integral, bad_lines) tuples of
+    read_parse_msblogfile_parallel to csv files in the order they are
+    received, without concatenating them in memory first. Values written
+    as integers in the logfile are written as integers, so the output is
+    the same as the one of decompose_logfile_stream.
+
+        Returns:
+            total number of lines that could not be parsed
+    """
+    writers = dict()
+    extension = f"csv.{compression}" if compression else "csv"
+    bad_lines = 0
+    try:
+        for data, integral, range_bad_lines in results:
+            bad_lines += range_bad_lines
+            for topic, array in data.items():
+                if topic not in writers:
+                    writers[topic] = TopicWriter(
+                        get_output_filepath(output_dir, logfile_name, topic, extension=extension),
+                        topic,
+                        flush_size=flush_size,
+                    )
+                if verbose:
+                    print(f"writing {len(array)} {topic} samples")
+                writers[topic].extend(array, integral.get(topic))
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return bad_lines
 
 def gen_input_files(args : dict) -> iter:
     """
@@ -186,11 +836,44 @@ def validate_fpaths(fpaths : iter) -> iter:
         if os.path.isfile(fpath):
             yield fpath
 
-def concat_files(output_filepath : str, files : list):
-    with open(output_filepath, 'a') as output_filehandle:
+def read_header(filepath : str) -> bytes:
+    with open_compressed(filepath, 'rb') as fhandle:
+        return fhandle.readline()
+
+def copy_file_range(output_filehandle, input_filehandle, offset : int):
+    """
+    copy_file_range(output_filehandle, input_filehandle, offset : int)
+
+    copies everything from offset to the end of the input file to the
+    current position of the output file. Uncompressed files are copied
+    within the kernel by os.sendfile, without passing the data through
+    python. Compressed files, or platforms without sendfile, fall back to
+    large buffered block copies.
+    """
+    # compressed file objects return the fileno of the underlying
+    # compressed file, so only plain files qualify for sendfile
+    if type(getattr(input_filehandle, "raw", None)) is io.FileIO and type(output_filehandle) is io.FileIO:
+        input_fd = input_filehandle.fileno()
+        output_fd = output_filehandle.fileno()
+        count = os.fstat(input_fd).st_size - offset
+        try:
+            while count > 0:
+                sent = os.sendfile(output_fd, input_fd, offset, count)
+                if sent == 0:
+                    return
+                offset += sent
+                count -= sent
+            return
+        except (AttributeError, OSError):
+            pass
+    seek_forward(input_filehandle, offset)
+    shutil.copyfileobj(input_filehandle, output_filehandle, COPY_BUFSIZE)
+
+def concat_lines(output_filepath : str, files : list):
+    with open_compressed(output_filepath, 'at') as output_filehandle:
         header_written = False
         for _, file in files:
-            with open(file, 'r') as input_filehandle:
+            with open_compressed(file, 'rt') as input_filehandle:
                 header = input_filehandle.readline()
                 if not header_written:
                     output_filehandle.write(header)
@@ -198,4 +881,98 @@ def concat_files(output_filepath : str, files : list):
                 for line in input_filehandle:
                     output_filehandle.write(line)
 
+def concat_files(output_filepath : str, files : list):
+    """
+    concat_files(output_filepath : str, files : list)
+
+    appends the given csv files to output_filepath, keeping only the header
+    of the first file. files is a list of (timestamp, filepath) tuples as
+    returned by partition_files_by_timestamp.
+
+    The header length is determined once per file and the remaining bytes
+    are copied as a whole, see copy_file_range. Only if the headers of the
+    files differ, the files are concatenated line by line.
+    """
+    if not files:
+        return
+    headers = [read_header(file) for _, file in files]
+    if any(header != headers[0] for header in headers):
+        concat_lines(output_filepath, files)
+        return
+    if split_extension(output_filepath)[2]:
+        output_filehandle = open_compressed(output_filepath, 'ab')
+    else:
+        # sendfile refuses to write to files opened with O_APPEND. The raw,
+        # unbuffered file keeps python and the kernel agreeing on the position
+        output_filehandle = open(output_filepath, 'r+b' if os.path.exists(output_filepath) else 'wb', buffering=0)
+        output_filehandle.seek(0, os.SEEK_END)
+    with output_filehandle:
+        output_filehandle.write(headers[0])
+        for (_, file), header in zip(files, headers):
+            with open_compressed(file, 'rb') as input_filehandle:
+                copy_file_range(output_filehandle, input_filehandle, len(header))
+
+
 
+def epoch_keyed_lines(filepath : str, input_filehandle) -> iter:
+    """
+    yields (epoch, line) tuples for all data lines of an open csv file and
+    raises a ValueError if the file is not sorted by epoch
+    """
+    last_epoch = float('-inf')
+    for line in input_filehandle:
+        if not line.strip():
+            continue
+        if not line.endswith('\n'):
+            line += '\n'
+        epoch = float(line.split(',', 1)[0])
+        if epoch < last_epoch:
+            raise ValueError(f'{filepath} is not sorted by epoch')
+        last_epoch = epoch
+        yield (epoch, line)
+
+def merge_files(output_filepath : str, files : list):
+    """
+    merge_files(output_filepath : str, files : list)
+
+    merges csv files that are each sorted by epoch into a single file that
+    is sorted by epoch and contains every epoch only once. The files are
+    streamed through a k-way merge (heapq.merge), so memory usage does not
+    depend on the file sizes. Of rows with the same epoch the one from the
+    later file is kept, like read_csv_files does. files is a list of
+    (timestamp, filepath) tuples as returned by partition_files_by_timestamp.
+    """
+    if not files:
+        return
+    with ExitStack() as stack:
+        input_filehandles = [stack.enter_context(open_compressed(file, 'rt')) for _, file in files]
+        headers = [input_filehandle.readline() for input_filehandle in input_filehandles]
+        if any(header != headers[0] for header in headers):
+            raise ValueError(f'can not merge files with different headers: {files[0][1]} .. {files[-1][1]}')
+        with open_compressed(output_filepath, 'at') as output_filehandle:
+            output_filehandle.write(headers[0])
+            pending = None
+            for epoch, line in heapq.merge(
+                *(epoch_keyed_lines(file, input_filehandle) for (_, file), input_filehandle in zip(files, input_filehandles)),
+                key=lambda item: item[0],
+            ):
+                if pending and epoch != pending[0]:
+                    output_filehandle.write(pending[1])
+                pending = (epoch, line)
+            if pending:
+                output_filehandle.write(pending[1])
+
+def concat_data_files(output_filepath : str, files : list, output_format : str, merge : bool = False):
+    """
+    concat_data_files(output_filepath : str, files : list, output_format : str, merge : bool = False)
+
+    concatenates data files of any supported format into a single file of
+    the given output format. files is a list of (timestamp, filepath) tuples
+    as returned by partition_files_by_timestamp. With merge, the rows are
+    sorted by epoch and duplicate epochs are dropped, keeping the last one,
+    like merge_files does for csv files.
+    """
+    data = pd.concat([read_data_file(file) for _, file in files], ignore_index=True)
+    if merge:
+        data = data.sort_values('epoch', kind='stable').drop_duplicates('epoch', keep='last')
+    write_dataframe(data, output_filepath, output_format)
@@ -0,0 +1,182 @@
+import gzip
+import io
+import lzma
+import numpy as np
+import os
+import pandas as pd
+
+# csv: plain text, as written by decompose_logfile_stream
+# parquet: zstd compressed, requires pyarrow
+# feather: lz4 compressed arrow ipc file, requires pyarrow
+# npz: compressed numpy archive holding one array per column
+OUTPUT_FORMATS = ("csv", "parquet", "feather", "npz")
+
+# file extension and magic bytes of the supported compressions. zstd
+# requires the zstandard package
+COMPRESSIONS = {"gz": "gzip", "xz": "xz", "zst": "zstd"}
+COMPRESSION_MAGIC = {
+    "gzip": b"\x1f\x8b",
+    "xz": b"\xfd7zXZ\x00",
+    "zstd": b"\x28\xb5\x2f\xfd",
+}
+
+
+def detect_compression(filepath: str) -> str:
+    """
+    returns the compression of a file based on its magic bytes, or None for
+    uncompressed files
+    """
+    with open(filepath, "rb") as fhandle:
+        head = fhandle.read(6)
+    for compression, magic in COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def split_extension(filepath: str) -> tuple:
+    """
+    split_extension(filepath : str) -> tuple
+
+    splits a file path into the path without extension, the data format
+    extension and the compression extension, e.g.
+    imu_msb-0021-a.csv.gz -> (imu_msb-0021-a, csv, gz)
+    The compression extension is None for uncompressed files.
+    """
+    root, extension = os.path.splitext(filepath)
+    if extension[1:] in COMPRESSIONS:
+        root, format_extension = os.path.splitext(root)
+        return (root, format_extension[1:], extension[1:])
+    return (root, extension[1:], None)
+
+
+def open_compressed(filepath: str, mode: str = "rt"):
+    """
+    open_compressed(filepath : str, mode : str = "rt")
+
+    opens a file, transparently (de)compressing it. When reading, the
+    compression is detected from the magic bytes of the file, when writing
+    or appending it is selected by the file extension (.gz, .xz, .zst).
+    Compressed files are streamed, they are never decompressed to disk.
+    """
+    if "r" in mode:
+        compression = detect_compression(filepath)
+    else:
+        compression = COMPRESSIONS.get(split_extension(filepath)[2])
+    if compression == "gzip":
+        return gzip.open(filepath, mode)
+    elif compression == "xz":
+        return lzma.open(filepath, mode)
+    elif compression == "zstd":
+        import zstandard
+
+        if "r" in mode:
+            # the raw decompression reader can neither read lines nor be
+            # iterated, buffering it provides both
+            fhandle = io.BufferedReader(zstandard.open(filepath, "rb"))
+            return fhandle if "b" in mode else io.TextIOWrapper(fhandle)
+        return zstandard.open(filepath, mode)
+    return open(filepath, mode)
+
+
+def seek_forward(fhandle, offset: int):
+    """
+    moves a file freshly opened for reading to offset. Streams that cannot
+    seek, e.g. zstd readers, are read and discarded up to offset.
+    """
+    if fhandle.seekable():
+        fhandle.seek(offset)
+        return
+    while offset > 0 and (block := fhandle.read(min(offset, 1 << 20))):
+        offset -= len(block)
+
+
+def to_dataframe(array: np.ndarray, columns: tuple) -> pd.DataFrame:
+    """
+    to_dataframe(array : np.ndarray, columns : tuple) -> pd.DataFrame
+
+    converts a 2D array of samples into a DataFrame. Columns of object arrays
+    (e.g. gps samples, which contain the time string) are converted to
+    numeric types wherever possible, so every column is stored typed.
+    """
+    data = pd.DataFrame(array, columns=list(columns))
+    if array.dtype == object:
+        for column in data.columns:
+            try:
+                data[column] = pd.to_numeric(data[column])
+            except (ValueError, TypeError):
+                data[column] = data[column].astype(str)
+    return data
+
+
+def write_dataframe(data: pd.DataFrame, output_filepath: str, output_format: str):
+    """
+    write_dataframe(data : pd.DataFrame, output_filepath : str, output_format : str)
+
+    writes the DataFrame in one of the OUTPUT_FORMATS. The index is not
+    stored, the epoch is expected to be a regular column.
+    """
+    assert output_format in OUTPUT_FORMATS, f"not a valid output format: {output_format}"
+    data = data.reset_index(drop=True)
+    if output_format == "csv":
+        data.to_csv(output_filepath, index=False)
+    elif output_format == "parquet":
+        data.to_parquet(output_filepath, index=False, compression="zstd")
+    elif output_format == "feather":
+        data.to_feather(output_filepath, compression="lz4")
+    elif output_format == "npz":
+        np.savez_compressed(
+            output_filepath,
+            **{
+                column: data[column].to_numpy(
+                    dtype=None if pd.api.types.is_numeric_dtype(data[column]) else str
+                )
+                for column in data.columns
+            },
+        )
+
+
+def read_data_file(filepath: str) -> pd.DataFrame:
+    """
+    read_data_file(filepath : str) -> pd.DataFrame
+
+    reads a data file written in any of the OUTPUT_FORMATS. The format is
+    determined by the file extension, unknown extensions are read as csv.
+    Arrow based formats are memory mapped instead of being read into a
+    buffer first. Compressed csv files are decompressed on the fly.
+    """
+    extension = split_extension(filepath)[1]
+    if extension == "parquet":
+        return pd.read_parquet(filepath, memory_map=True)
+    elif extension == "feather":
+        from pyarrow import feather
+
+        return feather.read_table(filepath, memory_map=True).to_pandas()
+    elif extension == "npz":
+        with np.load(filepath) as npz:
+            return pd.DataFrame({column: npz[column] for column in npz.files})
+    else:
+        with open_compressed(filepath, "rb") as fhandle:
+            return pd.read_csv(fhandle)
+
+
+def read_epochs(filepath: str) -> np.ndarray:
+    """
+    read_epochs(filepath : str) -> np.ndarray
+
+    reads only the epoch column of a data file written in any of the
+    OUTPUT_FORMATS
+    """
+    extension = split_extension(filepath)[1]
+    if extension == "parquet":
+        return pd.read_parquet(filepath, columns=["epoch"]).epoch.to_numpy()
+    elif extension == "feather":
+        from pyarrow import feather
+
+        return feather.read_table(filepath, columns=["epoch"], memory_map=True).column("epoch").to_numpy()
+    elif extension == "npz":
+        with np.load(filepath) as npz:
+            return npz["epoch"]
+    else:
+        with open_compressed(filepath, "rb") as fhandle:
+            return pd.read_csv(fhandle, usecols=["epoch"]).epoch.to_numpy()
@@ -1,6 +1,15 @@
-from config import SSH_USER, SSH_KEYFILE, REMOTE_SERVER
+from concurrent.futures import ThreadPoolExecutor
+from config import SSH_USER, SSH_KEYFILE, REMOTE_SERVER, MSB_LOCAL_DATA_DIR
+from msbmanifest import load_manifest, save_manifest
 from ssh import ssh_exec
 import subprocess
+import threading
+import time
+
+# registry of the last probe of every box, see assemble_hosts
+HOST_REGISTRY_FILENAME = ".msb_hosts.json"
+HOST_REGISTRY_TTL = 300
+_host_registry_lock = threading.Lock()
 
 def serial2hostname(serialnumber : str, tld : str = 'local') -> str:
     return f'{serialnumber}.{tld}'
@@ -59,9 +68,73 @@ def assemble_hosts_remote(serialnumber : str, verbose : bool = False) -> iter:
     else:
         return None
 
-def assemble_hosts(serialnumbers : list, remote : bool = False, verbose : bool = False) -> iter:
+def probe_host(serialnumber : str, remote : bool = False, verbose : bool = False) -> dict:
+    """
+    probe_host(serialnumber : str, remote : bool = False, verbose : bool = False) -> dict
+
+    checks whether a motion sensor box is reachable and returns its registry
+    entry: reachable, the ssh access string, the time of the probe, the
+    time the box was last seen and the duration of the probe in seconds
+    """
+    t_probe = time.time()
+    if remote:
+        host_access = assemble_hosts_remote(serialnumber, verbose=verbose)
+    else:
+        host_access = assemble_hosts_local(serialnumber, verbose=verbose)
+    latency = time.time() - t_probe
+    return {
+        "reachable": bool(host_access),
+        "access": host_access[1] if host_access else None,
+        "probed": t_probe,
+        "last_seen": t_probe if host_access else None,
+        "latency": latency,
+    }
+
+
+def discover_hosts(serialnumbers : list, remote : bool = False, ttl : float = HOST_REGISTRY_TTL, verbose : bool = False) -> dict:
     """
-    assemble_hosts(serialnumbers : list, remote : bool = False, verbose : bool = False) -> iter
+    discover_hosts(serialnumbers : list, remote : bool = False, ttl : float = HOST_REGISTRY_TTL, verbose : bool = False) -> dict
+
+    returns the registry entries of the given boxes. Entries probed less
+    than ttl seconds ago are taken from the registry in MSB_LOCAL_DATA_DIR,
+    all other boxes are probed concurrently, so offline boxes cost one
+    connect timeout in total instead of one each. ttl=0 probes all boxes.
+
+        Returns:
+            dict mapping the serial numbers to their registry entries
+    """
+    mode = "remote" if remote else "local"
+    serialnumbers = [serialnumber.lower() for serialnumber in serialnumbers]
+    with _host_registry_lock:
+        registry = load_manifest(MSB_LOCAL_DATA_DIR, HOST_REGISTRY_FILENAME).get(mode, dict())
+    hosts = {
+        serialnumber: registry[serialnumber]
+        for serialnumber in serialnumbers
+        if serialnumber in registry and time.time() - registry[serialnumber]["probed"] < ttl
+    }
+    stale = [serialnumber for serialnumber in serialnumbers if serialnumber not in hosts]
+    if not stale:
+        return hosts
+    if verbose:
+        print(f'probing {len(stale)} hosts: {" ".join(stale)}')
+    with ThreadPoolExecutor(max_workers=len(stale)) as executor:
+        probed = dict(zip(stale, executor.map(lambda serialnumber: probe_host(serialnumber, remote=remote, verbose=verbose), stale)))
+    # merged into the current registry, other threads or processes may
+    # have updated other boxes in the meantime
+    with _host_registry_lock:
+        full_registry = load_manifest(MSB_LOCAL_DATA_DIR, HOST_REGISTRY_FILENAME)
+        for serialnumber, entry in probed.items():
+            if not entry["reachable"] and serialnumber in full_registry.get(mode, dict()):
+                entry["last_seen"] = full_registry[mode][serialnumber].get("last_seen")
+            full_registry.setdefault(mode, dict())[serialnumber] = entry
+        save_manifest(MSB_LOCAL_DATA_DIR, full_registry, HOST_REGISTRY_FILENAME)
+    hosts.update(probed)
+    return hosts
+
+
+def assemble_hosts(serialnumbers : list, remote : bool = False, verbose : bool = False, ttl : float = HOST_REGISTRY_TTL) -> iter:
+    """
+    assemble_hosts(serialnumbers : list, remote : bool = False, verbose : bool = False, ttl : float = HOST_REGISTRY_TTL) -> iter
 
     Parameters:
         serialnumbers (list): A list containing serialnumbers of motion sensor
@@ -72,20 +145,20 @@ def assemble_hosts(serialnumbers : list, remote : bool = False, verbose : bool =
 
         verbose (bool): flag to display debugging information
 
+        ttl (float): results of probes younger than ttl seconds are taken
+            from the host registry, see discover_hosts. 0 probes all boxes
+
     Returns:
         Returns an iterator of tuples containing the serialnumber (str)
         and an ssh access string, that can be used to fetch data or execute
         remote bash commands
 
     """
+    hosts = discover_hosts(serialnumbers, remote=remote, ttl=ttl, verbose=verbose)
     for serialnumber in serialnumbers:
         serialnumber = serialnumber.lower()
         if verbose:
             print(f'processing serialnumber: {serialnumber}')
-        if remote:
-            if host_access := assemble_hosts_remote(serialnumber, verbose=verbose):
-                yield host_access
-        else:
-            if host_access := assemble_hosts_local(serialnumber, verbose=verbose):
-                yield host_access
+        if hosts[serialnumber]["reachable"]:
+            yield (serialnumber, hosts[serialnumber]["access"])
 
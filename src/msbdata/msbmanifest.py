@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+
+from msbformats import open_compressed, seek_forward
+
+MANIFEST_FILENAME = ".msbdata_manifest.json"
+# number of bytes right before the processed offset of a logfile whose
+# checksum is recorded, to tell appended data from a rewritten logfile
+RESUME_CHECK_SIZE = 4096
+# manifest of the files fetched from a box, kept in MSB_LOCAL_DATA_DIR/<serial>
+FETCH_MANIFEST_FILENAME = ".msbfetch_manifest.json"
+
+
+def manifest_path(output_dir: str, filename: str = MANIFEST_FILENAME) -> str:
+    return os.path.join(output_dir, filename)
+
+
+def load_manifest(output_dir: str, filename: str = MANIFEST_FILENAME) -> dict:
+    """
+    load_manifest(output_dir : str, filename : str = MANIFEST_FILENAME) -> dict
+
+    loads the extraction manifest of the given output directory. The
+    manifest maps absolute logfile paths to a dict containing the size and
+    mtime of the logfile and the byte offset up to which it has been
+    processed. Returns an empty manifest if there is none yet.
+    """
+    try:
+        with open(manifest_path(output_dir, filename), "r") as manifest_fhandle:
+            return json.load(manifest_fhandle)
+    except FileNotFoundError:
+        return dict()
+
+
+def save_manifest(output_dir: str, manifest: dict, filename: str = MANIFEST_FILENAME):
+    """
+    save_manifest(output_dir : str, manifest : dict, filename : str = MANIFEST_FILENAME)
+
+    writes the manifest to a temporary file first and moves it in place, so
+    an interrupted run never leaves a truncated manifest behind.
+    """
+    tmp_path = f"{manifest_path(output_dir, filename)}.tmp"
+    with open(tmp_path, "w") as manifest_fhandle:
+        json.dump(manifest, manifest_fhandle, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path(output_dir, filename))
+
+
+def processed_md5(logfile: str, offset: int) -> str:
+    """md5 hex digest of the RESUME_CHECK_SIZE bytes of a logfile before offset"""
+    begin = max(0, offset - RESUME_CHECK_SIZE)
+    with open_compressed(logfile, "rb") as logfile_fhandle:
+        seek_forward(logfile_fhandle, begin)
+        return hashlib.md5(logfile_fhandle.read(offset - begin)).hexdigest()
+
+
+def manifest_entry(stat: os.stat_result, offset: int, logfile: str) -> dict:
+    """
+    stat has to be taken before the logfile is processed. Data appended
+    while processing then changes size/mtime and is picked up by the next run.
+    """
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "offset": offset,
+        "md5": processed_md5(logfile, offset),
+    }
+
+
+def resume_offset(stat: os.stat_result, entry: dict, logfile: str) -> int:
+    """
+    resume_offset(stat : os.stat_result, entry : dict, logfile : str) -> int
+
+    returns the byte offset from which the logfile has to be processed:
+    None if the logfile is unchanged since the last run, and the recorded
+    offset if data has only been appended since, i.e. the logfile has grown
+    and the bytes before the offset are still the same. Whenever size or
+    mtime differ otherwise, e.g. a logfile rewritten with the same size, the
+    logfile is processed again from 0.
+    """
+    if not entry:
+        return 0
+    if stat.st_size == entry["size"] and stat.st_mtime == entry["mtime"]:
+        return None
+    if stat.st_size <= entry["size"] or stat.st_size < entry["offset"]:
+        return 0
+    if entry.get("md5") != processed_md5(logfile, entry["offset"]):
+        return 0
+    return entry["offset"]
+
+
+def fetch_offset(size: int, mtime: float, entry: dict, local_size: int) -> int:
+    """
+    fetch_offset(size : int, mtime : float, entry : dict, local_size : int) -> int
+
+    decides how a remote file of the given size and mtime has to be fetched,
+    given its fetch manifest entry and the size of the local copy (0 if
+    there is none). Returns None if the local copy is complete, the size
+    of the local copy if only the remaining bytes have to be transferred
+    (interrupted transfer, or a logfile that has grown since), and 0 if the
+    whole file has to be transferred.
+    """
+    if entry and entry["size"] == size and entry["mtime"] == mtime and local_size == size:
+        return None
+    if entry and entry["mtime"] != mtime and entry["size"] >= size:
+        # modified without growing, i.e. rewritten instead of appended to
+        return 0
+    if local_size == size:
+        return None
+    if 0 < local_size < size:
+        return local_size
+    return 0
+
+
+def file_md5(filepath: str, length: int = None) -> str:
+    """md5 hex digest of the first length bytes of a file, or of all of it"""
+    md5 = hashlib.md5()
+    remaining = length
+    with open(filepath, "rb") as fhandle:
+        while remaining is None or remaining > 0:
+            block = fhandle.read(1 << 20 if remaining is None else min(1 << 20, remaining))
+            if not block:
+                break
+            md5.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return md5.hexdigest()
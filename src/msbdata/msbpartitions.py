@@ -0,0 +1,117 @@
+import json
+import os
+
+from msbformats import read_epochs
+
+# leading underscore: hive style dataset readers (e.g. pyarrow.dataset)
+# ignore the index when reading the partitioned directory
+PARTITION_INDEX_FILENAME = "_partition_index.json"
+
+
+def partition_keys(fpath: str, filename_sep: str = "_") -> tuple:
+    """
+    partition_keys(fpath : str, filename_sep : str = "_") -> tuple
+
+    derives the msb serial number and the sensor from the name of an
+    extracted data file, e.g. imu_msb-0021-a_2022-02-06T13-00-00.csv ->
+    (msb-0021-a, imu). Files without a sensor prefix get the sensor "all".
+    Further prefixes, e.g. of aggregated files, are ignored.
+    """
+    fields = os.path.basename(fpath).split(filename_sep)[:-1]
+    serial_fields = [i for i, field in enumerate(fields) if field.startswith("msb-")]
+    if len(serial_fields) == 1:
+        i = serial_fields[0]
+        return (filename_sep.join(fields[i:]), fields[i - 1] if i > 0 else "all")
+    if len(fields) < 2:
+        return (filename_sep.join(fields), "all")
+    return (filename_sep.join(fields[1:]), fields[0])
+
+
+def partition_dir(output_dir: str, msb: str, sensor: str, date: str) -> str:
+    """returns the hive style partition directory msb=../sensor=../date=.."""
+    return os.path.join(output_dir, f"msb={msb}", f"sensor={sensor}", f"date={date}")
+
+
+def index_path(output_dir: str) -> str:
+    return os.path.join(output_dir, PARTITION_INDEX_FILENAME)
+
+
+def load_partition_index(output_dir: str) -> dict:
+    """
+    load_partition_index(output_dir : str) -> dict
+
+    loads the partition index of a partitioned output directory. The index
+    maps partition directories, relative to output_dir, to the min/max
+    epoch and the number of rows of the partition and of each of its
+    files. Returns an empty index if there is none yet.
+    """
+    try:
+        with open(index_path(output_dir), "r") as index_fhandle:
+            return json.load(index_fhandle)
+    except FileNotFoundError:
+        return dict()
+
+
+def save_partition_index(output_dir: str, index: dict):
+    """writes the index atomically, see save_manifest"""
+    tmp_path = f"{index_path(output_dir)}.tmp"
+    with open(tmp_path, "w") as index_fhandle:
+        json.dump(index, index_fhandle, indent=1, sort_keys=True)
+    os.replace(tmp_path, index_path(output_dir))
+
+
+def data_file_stats(filepath: str) -> dict:
+    """returns min/max epoch and the number of rows of a data file"""
+    epochs = read_epochs(filepath)
+    if not len(epochs):
+        return {"min_epoch": None, "max_epoch": None, "rows": 0}
+    return {"min_epoch": float(epochs.min()), "max_epoch": float(epochs.max()), "rows": len(epochs)}
+
+
+def update_partition_index(index: dict, output_dir: str, filepath: str, stats: dict):
+    """
+    update_partition_index(index : dict, output_dir : str, filepath : str, stats : dict)
+
+    records the stats of a data file in the index and updates the totals of
+    its partition
+    """
+    partition, filename = os.path.split(os.path.relpath(filepath, output_dir))
+    files = index.setdefault(partition, dict()).setdefault("files", dict())
+    files[filename] = stats
+    epochs = [
+        epoch
+        for file_stats in files.values()
+        for epoch in (file_stats["min_epoch"], file_stats["max_epoch"])
+        if epoch is not None
+    ]
+    index[partition].update(
+        min_epoch=min(epochs, default=None),
+        max_epoch=max(epochs, default=None),
+        rows=sum(file_stats["rows"] for file_stats in files.values()),
+    )
+
+
+def select_partition_files(
+    output_dir: str, begin: float, end: float, msb: str = None, sensor: str = None
+) -> list:
+    """
+    select_partition_files(output_dir : str, begin : float, end : float, msb : str = None, sensor : str = None) -> list
+
+    returns the sorted paths of all files in a partitioned output directory
+    that contain data between the epochs begin and end, optionally
+    restricted to one msb and/or sensor. Only the index is consulted, no
+    data file is opened and no file name is parsed.
+    """
+    selected = list()
+    for partition, partition_stats in load_partition_index(output_dir).items():
+        keys = dict(field.split("=", 1) for field in partition.split(os.path.sep))
+        if msb and keys.get("msb") != msb:
+            continue
+        if sensor and keys.get("sensor") != sensor:
+            continue
+        if partition_stats["rows"] == 0 or partition_stats["max_epoch"] < begin or partition_stats["min_epoch"] > end:
+            continue
+        for filename, stats in partition_stats["files"].items():
+            if stats["rows"] and stats["max_epoch"] >= begin and stats["min_epoch"] <= end:
+                selected.append(os.path.join(output_dir, partition, filename))
+    return sorted(selected)
@@ -1,18 +1,165 @@
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
+import numpy as np
+import os
 import time
 import sys
 
 AGGREGATION_INTERVALS = ["hourly", "daily", "weekly", "monthly", "all"]
 
+# epoch of the time stamps that could not be parsed
+NO_EPOCH = np.iinfo(np.int64).min
+
+# layouts of the msb time stamp formats parse_timestamp_strings handles
+# without strptime: Y, M, D, h, m, s mark the digits, all other characters
+# have to match literally. The flag tells whether a utc offset follows
+# (+HHMM, +HH:MM or Z).
+FIXED_TIMESTAMP_FORMATS = {
+    "%Y%m%dT%H%M%S%z": ("YYYYMMDDThhmmss", True),
+    "%Y%m%dT%H%M%S": ("YYYYMMDDThhmmss", False),
+    "%Y-%m-%dT%H-%M-%S": ("YYYY-MM-DDThh-mm-ss", False),
+    "%Y-%m-%dT%H:%M:%S%z": ("YYYY-MM-DDThh:mm:ss", True),
+    "%Y-%m-%dT%H:%M:%S": ("YYYY-MM-DDThh:mm:ss", False),
+}
+
 def parse_fmt_timestamp_string(timestamp_string : str, fmt : str = "%Y-%m-%dT%H-%M-%S", verbose=False) -> datetime:
     try:
-        timestamp = datetime(*time.strptime(timestamp_string, fmt)[:6])
+        timestamp = datetime.strptime(timestamp_string, fmt)
     except Exception as e:
         if verbose:
             print(f'failed to parse time stamp: {timestamp_string}: {e}.. skipping')
         return None
-    timestamp = timestamp.replace(tzinfo=timezone.utc)
-    return timestamp
+    # a utc offset parsed via %z is applied, time stamps without one are utc
+    if timestamp.tzinfo:
+        return timestamp.astimezone(timezone.utc)
+    return timestamp.replace(tzinfo=timezone.utc)
+
+def _layout_number(digits : np.ndarray, layout : str, field : str) -> np.ndarray:
+    """the number made of the digits at the positions of field in layout"""
+    number = np.zeros(len(digits), dtype=np.int64)
+    for position in [i for i, c in enumerate(layout) if c == field]:
+        number = number * 10 + digits[:, position]
+    return number
+
+def _days_from_civil(year : np.ndarray, month : np.ndarray, day : np.ndarray) -> np.ndarray:
+    """days since 1970-01-01 of proleptic gregorian dates"""
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+def _utc_offsets(chars : np.ndarray, lengths : np.ndarray, start : int) -> tuple:
+    """
+    utc offsets in seconds of the +HHMM, +HH:MM or Z suffixes starting at
+    start, and whether the suffix is valid
+    """
+    suffix = np.zeros((len(chars), 6), dtype=np.uint8)
+    width = min(6, chars.shape[1] - start)
+    suffix[:, :width] = chars[:, start:start + width]
+    suffix_length = lengths - start
+    digits = suffix.astype(np.int64) - ord("0")
+    is_digit = (digits >= 0) & (digits <= 9)
+    sign = np.where(suffix[:, 0] == ord("-"), -1, 1)
+    signed = (suffix[:, 0] == ord("+")) | (suffix[:, 0] == ord("-"))
+    compact = signed & (suffix_length == 5) & is_digit[:, 1:5].all(axis=1)
+    extended = signed & (suffix_length == 6) & is_digit[:, [1, 2, 4, 5]].all(axis=1) & (suffix[:, 3] == ord(":"))
+    zulu = (suffix_length == 1) & (suffix[:, 0] == ord("Z"))
+    hours = digits[:, 1] * 10 + digits[:, 2]
+    minutes = np.where(extended, digits[:, 4] * 10 + digits[:, 5], digits[:, 3] * 10 + digits[:, 4])
+    offsets = np.where(compact | extended, sign * (hours * 3600 + minutes * 60), 0)
+    return offsets, (compact | extended | zulu) & (hours <= 23) & (minutes <= 59)
+
+def parse_timestamp_strings(timestamp_strings : list, fmt : str = "%Y-%m-%dT%H-%M-%S", verbose=False) -> np.ndarray:
+    """
+    parse_timestamp_strings(timestamp_strings : list, fmt : str = "%Y-%m-%dT%H-%M-%S", verbose=False) -> np.ndarray
+
+    converts all time stamp strings to unix epochs at once. The formats in
+    FIXED_TIMESTAMP_FORMATS are parsed digit by digit on a byte matrix of
+    all strings; strptime (see parse_fmt_timestamp_string) is only used
+    for other formats and for strings not matching the layout. Time stamps
+    without utc offset are taken as UTC.
+
+        Parameters:
+            timestamp_strings: list of time stamp strings
+            fmt: strptime format of the time stamps
+
+        Returns:
+            int64 array of unix epochs, NO_EPOCH where parsing failed
+    """
+    timestamp_strings = list(timestamp_strings)
+    epochs = np.full(len(timestamp_strings), NO_EPOCH, dtype=np.int64)
+    valid = np.zeros(len(timestamp_strings), dtype=bool)
+    if timestamp_strings and fmt in FIXED_TIMESTAMP_FORMATS:
+        layout, has_offset = FIXED_TIMESTAMP_FORMATS[fmt]
+        try:
+            encoded = np.array(timestamp_strings, dtype=np.bytes_)
+        except UnicodeEncodeError:
+            encoded = np.array([string.encode("ascii", "replace") for string in timestamp_strings], dtype=np.bytes_)
+        width = max(encoded.dtype.itemsize, len(layout))
+        chars = np.zeros((len(encoded), width), dtype=np.uint8)
+        chars[:, :encoded.dtype.itemsize] = encoded.view(np.uint8).reshape(len(encoded), -1)
+        lengths = np.char.str_len(encoded)
+        digits = chars[:, :len(layout)].astype(np.int64) - ord("0")
+        digit_positions = [i for i, c in enumerate(layout) if c in "YMDhms"]
+        literal_positions = [i for i, c in enumerate(layout) if c not in "YMDhms"]
+        valid = ((digits[:, digit_positions] >= 0) & (digits[:, digit_positions] <= 9)).all(axis=1)
+        literals = np.frombuffer("".join(layout[i] for i in literal_positions).encode("ascii"), dtype=np.uint8)
+        valid &= (chars[:, literal_positions] == literals).all(axis=1)
+        year, month, day = (_layout_number(digits, layout, field) for field in "YMD")
+        hour, minute, second = (_layout_number(digits, layout, field) for field in "hms")
+        month_days = _days_from_civil(year + (month == 12), month % 12 + 1, 1) - _days_from_civil(year, month, 1)
+        valid &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days)
+        valid &= (hour <= 23) & (minute <= 59) & (second <= 59)
+        if has_offset:
+            offsets, valid_offsets = _utc_offsets(chars, lengths, len(layout))
+            valid &= valid_offsets
+        else:
+            offsets = 0
+            valid &= lengths == len(layout)
+        parsed = _days_from_civil(year, month, day) * 86400 + hour * 3600 + minute * 60 + second - offsets
+        epochs[valid] = parsed[valid]
+    for i in np.flatnonzero(~valid):
+        if timestamp := parse_fmt_timestamp_string(timestamp_strings[i], fmt, verbose=verbose):
+            epochs[i] = int(timestamp.timestamp())
+    return epochs
+
+def select_time_window(fpaths : list, begin : float, end : float, timestamp_fmt : str = "%Y-%m-%dT%H:%M:%S%z", field_sep : str = "_") -> list:
+    """
+    select_time_window(fpaths : list, begin : float, end : float, timestamp_fmt : str = "%Y-%m-%dT%H:%M:%S%z", field_sep : str = "_") -> list
+
+    selects the files with a time stamp in their name between the epochs
+    begin and end, plus the last file before begin, which may still contain
+    data from after begin. The time stamps of each source (same directory
+    and name without time stamp) are parsed in one vectorized call, names
+    without a valid time stamp are dropped and the window is found by
+    bisecting the sorted epochs.
+
+        Parameters:
+            fpaths: file paths, the time stamp after the last field_sep
+            begin, end: unix epochs of the time window
+            timestamp_fmt: format of the time stamps
+
+        Returns:
+            sorted list of the selected file paths
+    """
+    sources = dict()
+    for fpath in fpaths:
+        sources.setdefault(fpath.rsplit(field_sep, 1)[0], list()).append(fpath)
+
+    selected = list()
+    for source_fpaths in sources.values():
+        epochs = parse_timestamp_strings(
+            [os.path.basename(fpath).split(".")[0].split(field_sep)[-1] for fpath in source_fpaths], timestamp_fmt
+        )
+        valid = np.flatnonzero(epochs != NO_EPOCH)
+        # names without utc offset sort like time, names with one may not
+        order = valid[np.argsort(epochs[valid], kind="stable")]
+        sorted_epochs = epochs[order]
+        first = max(int(np.searchsorted(sorted_epochs, begin, side="left")) - 1, 0)
+        last = int(np.searchsorted(sorted_epochs, end, side="right"))
+        selected += [source_fpaths[i] for i in order[first:last].tolist()]
+    return sorted(selected)
 
 def parse_generic_timestamp_string(timestamp_string : str) -> datetime:
     try:
@@ -34,53 +181,31 @@ def parse_begin_end(config : dict) -> tuple:
         end = datetime.fromtimestamp(time.time(), timezone.utc)
     return (begin, end)
 
-def are_in_equivalent_datetime_interval(
-    timestamp: datetime, interval_boundary: datetime, interval: str
-) -> bool:
+def floor_epochs(epochs : np.ndarray, interval : str) -> np.ndarray:
     """
-    receives two tuples objects x and y and checks if they are datetime
-    in their first field are equivalent
+    floor_epochs(epochs : np.ndarray, interval : str) -> np.ndarray
+
+    floors all unix epochs (UTC) to the start of their aggregation interval
+    at once. Weeks start on monday (ISO 8601), "all" maps every epoch to 0.
+
+        Parameters:
+            epochs: array of unix epochs in seconds
+            interval: one of AGGREGATION_INTERVALS
+
+        Returns:
+            int64 array of the interval start epochs, usable as bucket keys
     """
-    assert interval in AGGREGATION_INTERVALS
+    assert interval in AGGREGATION_INTERVALS, f'not a valid interval: {interval}'
+    epochs = np.floor(np.asarray(epochs, dtype=np.float64)).astype(np.int64)
     if interval == "all":
-        return True
+        return np.zeros_like(epochs)
     elif interval == "hourly":
-        return (
-            # timestamp.year == interval_boundary.year and
-            # timestamp.month == interval_boundary.month and
-            # timestamp.day == interval_boundary.day and
-            timestamp
-            <= (
-                datetime(
-                    year=interval_boundary.year,
-                    month=interval_boundary.month,
-                    day=interval_boundary.day,
-                    hour=interval_boundary.hour,
-                    tzinfo=timezone.utc,
-                )
-                + timedelta(hours=1)
-            )
-        )
+        return epochs - epochs % 3600
     elif interval == "daily":
-        return (
-            timestamp.year == interval_boundary.year
-            and timestamp.month == interval_boundary.month
-            and timestamp.day == interval_boundary.day
-        )
+        return epochs - epochs % 86400
     elif interval == "weekly":
-        dx = date(timestamp.year, timestamp.month, timestamp.day)
-        dy = date(
-            interval_boundary.year, interval_boundary.month, interval_boundary.day
-        )
-        return (
-            timestamp.year == interval_boundary.year
-            and timestamp.month == interval_boundary.month
-            and dx.isocalendar().week == dy.isocalendar().week
-        )
+        # 1970-01-01 was a thursday, i.e. three days after the start of its week
+        days = epochs // 86400
+        return (days - (days + 3) % 7) * 86400
     elif interval == "monthly":
-        return (
-            timestamp.year == interval_boundary.year
-            and timestamp.month == interval_boundary.month
-        )
-
-
+        return epochs.astype("datetime64[s]").astype("datetime64[M]").astype("datetime64[s]").astype(np.int64)
@@ -1,5 +1,130 @@
+import os
+import shlex
+import subprocess
 
+from config import SSH_KEYFILE, SSH_USER, REMOTE_SERVER, MSB_REMOTE_DATA_DIR, MSB_LOCAL_DATA_DIR
+from msbhosts import serial2port, serial2hostname
+from ssh import ssh_control_options
 
+TRANSFER_MODES = ("scp", "rsync", "tar")
 
-def copy_remote_local(ssh_access_string, data_fpath, test=True):
-    pass
+
+def assemble_ssh_transport(serialnumber : str, remote : bool) -> tuple:
+    """
+    returns the ssh command, including options, and the user@host part used
+    to reach a motion sensor box either directly or via its reverse tunnel
+    """
+    ssh_cmd = f'ssh -o ConnectTimeout=10 -o BatchMode=yes {ssh_control_options()} -i {SSH_KEYFILE}'
+    if remote:
+        return (f'{ssh_cmd} -p {serial2port(serialnumber)}', f'{SSH_USER}@{REMOTE_SERVER}')
+    return (ssh_cmd, f'{SSH_USER}@{serial2hostname(serialnumber)}')
+
+
+def relative_remote_paths(remote_datafile_paths : list) -> str:
+    """newline separated list of the paths relative to MSB_REMOTE_DATA_DIR"""
+    return "".join(
+        f'{os.path.relpath(remote_datafile_path, MSB_REMOTE_DATA_DIR)}\n'
+        for remote_datafile_path in remote_datafile_paths
+    )
+
+
+def assemble_rsync(serialnumber : str, local_path : str, remote : bool, append : bool = False, verbose : bool = False) -> list:
+    ssh_cmd, user_host = assemble_ssh_transport(serialnumber, remote)
+    # --files-from implies --relative, --no-relative stores all files
+    # directly in local_path like scp does. With append, --append-verify
+    # only transfers the new part of grown logfiles and copies files again
+    # that fail the verification. Otherwise --ignore-times makes sure files
+    # rewritten on the box are transferred even if size and mtime match.
+    rsync_cmd = [
+        'rsync', '--archive', '--compress', '--partial', '--no-relative',
+        '--append-verify' if append else '--ignore-times',
+        '--files-from=-', '-e', ssh_cmd,
+        f'{user_host}:{MSB_REMOTE_DATA_DIR}/', local_path,
+    ]
+    if verbose:
+        print(f'assembled rsync command: {shlex.join(rsync_cmd)}')
+    return rsync_cmd
+
+
+def copy_remote_datafiles_rsync(remote_datafile_paths : list, serialnumber : str, config : dict, append_paths : set = frozenset(), verbose : bool = False) -> int:
+    """
+    copy_remote_datafiles_rsync(remote_datafile_paths : list, serialnumber : str, config : dict, append_paths : set = frozenset(), verbose : bool = False) -> int
+
+    transfers all given files of a box with compressed rsync streams, the
+    file lists are passed via --files-from on stdin. Only the files in
+    append_paths, whose local copy is a complete prefix of the remote file,
+    are appended to. All other files are sent whole in a second stream, so
+    files rewritten on the box replace their stale local copy.
+
+        Returns:
+            exit code of the first rsync that failed, 0 on success
+    """
+    local_data_dir = os.path.join(MSB_LOCAL_DATA_DIR, serialnumber)
+    os.makedirs(local_data_dir, exist_ok=True)
+    for append in (True, False):
+        paths = [path for path in remote_datafile_paths if (path in append_paths) == append]
+        if not paths:
+            continue
+        rsync_process = subprocess.Popen(
+            assemble_rsync(serialnumber, local_data_dir, config['remote'], append=append, verbose=verbose),
+            stdin=subprocess.PIPE,
+        )
+        rsync_process.communicate(relative_remote_paths(paths).encode('utf-8'))
+        if rsync_process.returncode:
+            return rsync_process.returncode
+    return 0
+
+
+def copy_remote_datafiles_tar(remote_datafile_paths : list, serialnumber : str, config : dict, verbose : bool = False) -> int:
+    """
+    copy_remote_datafiles_tar(remote_datafile_paths : list, serialnumber : str, config : dict, verbose : bool = False) -> int
+
+    transfers all given files of a box as one gzip compressed tar stream
+    over a single ssh channel and unpacks it on the fly. Works on boxes
+    without rsync.
+
+        Returns:
+            exit code of the remote tar, or of the local tar if that failed
+    """
+    local_data_dir = os.path.join(MSB_LOCAL_DATA_DIR, serialnumber)
+    os.makedirs(local_data_dir, exist_ok=True)
+    ssh_cmd, user_host = assemble_ssh_transport(serialnumber, config['remote'])
+    tar_cmd = f'{ssh_cmd} {user_host} tar -C {MSB_REMOTE_DATA_DIR} -czf - -T -'
+    # the transform stores all files directly in local_data_dir like scp does
+    untar_cmd = ['tar', '-xzf', '-', '-C', local_data_dir, '--transform', 's,.*/,,']
+    if verbose:
+        print(f'executing {tar_cmd} | {shlex.join(untar_cmd)}')
+    tar_process = subprocess.Popen(tar_cmd, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    untar_process = subprocess.Popen(untar_cmd, stdin=tar_process.stdout)
+    # the local tar holds the only remaining reference to the pipe, so it
+    # gets EOF when the remote tar terminates
+    tar_process.stdout.close()
+    try:
+        tar_process.stdin.write(relative_remote_paths(remote_datafile_paths).encode('utf-8'))
+        tar_process.stdin.close()
+    except BrokenPipeError:
+        # ssh failed to connect, the exit code tells
+        pass
+    untar_returncode = untar_process.wait()
+    tar_returncode = tar_process.wait()
+    return tar_returncode or untar_returncode
+
+
+def copy_remote_datafiles(remote_datafile_paths : list, serialnumber : str, config : dict, append_paths : set = frozenset(), verbose : bool = False) -> int:
+    """
+    copy_remote_datafiles(remote_datafile_paths : list, serialnumber : str, config : dict, append_paths : set = frozenset(), verbose : bool = False) -> int
+
+    transfers all given files of a box in one stream, using rsync or tar
+    depending on config['transfer']. rsync appends to the local copies of
+    the files in append_paths, tar always sends whole files.
+
+        Returns:
+            exit code of the transfer, 0 on success
+    """
+    if not remote_datafile_paths:
+        return 0
+    if config['transfer'] == 'rsync':
+        return copy_remote_datafiles_rsync(remote_datafile_paths, serialnumber, config, append_paths=append_paths, verbose=verbose)
+    elif config['transfer'] == 'tar':
+        return copy_remote_datafiles_tar(remote_datafile_paths, serialnumber, config, verbose=verbose)
+    raise ValueError(f'not a batched transfer mode: {config["transfer"]}')
@@ -3,17 +3,19 @@ import subprocess
 
 from config import SSH_KEYFILE, SSH_USER, REMOTE_SERVER, MSB_LOCAL_DATA_DIR
 from msbhosts import serial2port, serial2hostname
+from ssh import ssh_control_options, ssh_exec, ssh_exec_to_file
+from msbmanifest import file_md5
 
 def assemble_scp_remote(serialnumber : str, remote_path : str, local_path : str, verbose : bool = False):
     remote_port = serial2port(serialnumber)
-    scp_cmd = f'scp -o ConnectTimeout=10 -o BatchMode=yes -i {SSH_KEYFILE} -P {remote_port} {SSH_USER}@{REMOTE_SERVER}:{remote_path} {local_path}'
+    scp_cmd = f'scp -o ConnectTimeout=10 -o BatchMode=yes {ssh_control_options()} -i {SSH_KEYFILE} -P {remote_port} {SSH_USER}@{REMOTE_SERVER}:{remote_path} {local_path}'
     if verbose:
         print(f'assembled scp command: {scp_cmd}')
     return scp_cmd
 
 def assemble_scp_local(serialnumber : str, remote_path : str, local_path : str, verbose : bool = False):
     remote_host = serial2hostname(serialnumber)
-    scp_cmd = f'scp -o ConnectTimeout=10 -o BatchMode=yes -i {SSH_KEYFILE} {SSH_USER}@{remote_host}:{remote_path} {local_path}'
+    scp_cmd = f'scp -o ConnectTimeout=10 -o BatchMode=yes {ssh_control_options()} -i {SSH_KEYFILE} {SSH_USER}@{remote_host}:{remote_path} {local_path}'
     if verbose:
         print(f'assembled scp command: {scp_cmd}')
     return scp_cmd
@@ -30,9 +32,34 @@ def copy_remote_datafile(remote_datafile_path : str, serialnumber : str, config
         print(f"executing {scp_cmd}")
     if test:
         return
-    stdout, stderr = subprocess.Popen(
+    scp_process = subprocess.Popen(
         scp_cmd,
         shell=True,
         #stdout=subprocess.STDOUT,
         #stderr=subprocess.DEVNULL
-    ).communicate()
+    )
+    scp_process.communicate()
+    return scp_process.returncode
+
+
+def resume_remote_datafile(remote_datafile_path : str, serialnumber : str, ssh_access_string : str, offset : int, verify : bool = False, verbose : bool = False) -> int:
+    """
+    resume_remote_datafile(remote_datafile_path : str, serialnumber : str, ssh_access_string : str, offset : int, verify : bool = False, verbose : bool = False) -> int
+
+    appends the bytes of a remote file from offset on to its local copy,
+    which has to be offset bytes long. Completes interrupted transfers and
+    fetches only the new part of logfiles that have grown since. With
+    verify, the md5 of the first offset bytes is compared first and the
+    whole file is copied again if the local copy does not match.
+
+        Returns:
+            exit code of the transfer, 0 on success
+    """
+    local_path = os.path.join(MSB_LOCAL_DATA_DIR, serialnumber, os.path.basename(remote_datafile_path))
+    if verify:
+        remote_md5 = ssh_exec(ssh_access_string, f'"head -c {offset} {remote_datafile_path} | md5sum"', verbose=verbose)
+        if not remote_md5 or remote_md5.split()[0] != file_md5(local_path, offset):
+            if verbose:
+                print(f'local copy of {remote_datafile_path} differs, copying it again')
+            return ssh_exec_to_file(ssh_access_string, f'cat {remote_datafile_path}', local_path, mode='wb', verbose=verbose)
+    return ssh_exec_to_file(ssh_access_string, f'tail -c +{offset + 1} {remote_datafile_path}', local_path, mode='ab', verbose=verbose)
@@ -1,13 +1,81 @@
+from contextlib import contextmanager
+from glob import glob
+import os
+import shutil
 import subprocess
+import tempfile
 from config import SSH_KEYFILE, SSH_USER, REMOTE_SERVER
 
+# seconds an idle master connection stays open. Sessions are closed
+# explicitly by close_ssh_sessions, this only bounds the lifetime of
+# masters left behind by a crashed run
+CONTROL_PERSIST = 60
+
+# directory holding the control sockets of the multiplexed sessions, None
+# if multiplexing is disabled
+_control_dir = None
+
+
+def open_ssh_sessions():
+    """
+    open_ssh_sessions()
+
+    enables connection multiplexing: the first ssh or scp command to a box
+    opens a master connection, all later commands to the same box reuse
+    it instead of doing a full handshake each. Use ssh_sessions() to make
+    sure the sessions are closed again.
+    """
+    global _control_dir
+    if _control_dir is None:
+        # unix socket paths are limited to ~100 characters, %C is a hash of
+        # user, host and port
+        _control_dir = tempfile.mkdtemp(prefix="msb-ssh-")
+
+
+def close_ssh_sessions():
+    """
+    close_ssh_sessions()
+
+    closes all master connections opened since open_ssh_sessions and
+    disables multiplexing again
+    """
+    global _control_dir
+    if _control_dir is None:
+        return
+    for control_path in glob(os.path.join(_control_dir, "*")):
+        # with a literal control path, the host argument is a mere placeholder
+        subprocess.run(
+            ["ssh", "-o", f"ControlPath={control_path}", "-O", "exit", "msb"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    shutil.rmtree(_control_dir, ignore_errors=True)
+    _control_dir = None
+
+
+@contextmanager
+def ssh_sessions():
+    open_ssh_sessions()
+    try:
+        yield
+    finally:
+        close_ssh_sessions()
+
+
+def ssh_control_options() -> str:
+    """returns the ssh/scp options to use the multiplexed sessions, if enabled"""
+    if _control_dir is None:
+        return ""
+    return f"-o ControlMaster=auto -o ControlPath={os.path.join(_control_dir, '%C')} -o ControlPersist={CONTROL_PERSIST}"
+
+
 def ssh_exec(ssh_remote_host: str, cmd: str, verbose : bool = False) -> str:
     # return subprocess.Popen(f'ssh {ssh_remote_host} {cmd}', shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()
     # stdout=subprocess.DEVNULL,
     # stderr=subprocess.STDOUT
     # this is way more difficult than anticipated: https://docs.python.org/3/library/subprocess.html
     # Popen().communicate() returns a tuple of (stdout, stderr), we only return stdout
-    ssh_cmd = f'ssh -o ConnectTimeout=10 -o BatchMode=yes {ssh_remote_host} {cmd}'
+    ssh_cmd = f'ssh -o ConnectTimeout=10 -o BatchMode=yes {ssh_control_options()} {ssh_remote_host} {cmd}'
     if verbose:
         print(f"executing {ssh_cmd}")
     output = subprocess.Popen(
@@ -24,4 +92,23 @@ def ssh_exec(ssh_remote_host: str, cmd: str, verbose : bool = False) -> str:
         return None
 
 
+def ssh_exec_to_file(ssh_remote_host: str, cmd: str, local_path: str, mode: str = "ab", verbose : bool = False) -> int:
+    """
+    ssh_exec_to_file(ssh_remote_host : str, cmd : str, local_path : str, mode : str = "ab", verbose : bool = False) -> int
+
+    like ssh_exec, but streams the binary output of the remote command
+    into local_path instead of returning it
 
+        Returns:
+            exit code of ssh, i.e. of the remote command
+    """
+    ssh_cmd = f'ssh -o ConnectTimeout=10 -o BatchMode=yes {ssh_control_options()} {ssh_remote_host} {cmd}'
+    if verbose:
+        print(f"executing {ssh_cmd} > {local_path}")
+    with open(local_path, mode) as local_fhandle:
+        return subprocess.Popen(
+            ssh_cmd,
+            shell=True,
+            stdout=local_fhandle,
+            stderr=subprocess.DEVNULL,
+        ).wait()
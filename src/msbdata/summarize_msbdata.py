@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+import argparse
+import base64
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone, timedelta
+import json
+import os
+import sys
+import time
+
+from config import MSB_REMOTE_DATA_DIR
+from msbhosts import assemble_hosts
+from ssh import ssh_exec, ssh_sessions
+
+import msb_agent
+
+BLOCK_COLUMNS = "epoch,max_acc_block_i,max_acc_block,std_acc_block,samples\n"
+GPS_COLUMNS = "epoch,lat,lon,alt\n"
+
+
+def parse_validate_cmdline() -> dict:
+    cmd_parser = argparse.ArgumentParser(
+        description="compute acceleration block statistics and a decimated gps track on the motion sensor boxes and fetch only the results"
+    )
+    cmd_parser.add_argument(
+        "--msb",
+        nargs="+",
+        default=None,
+        help="motion sensor box serial numbers to be summarized",
+    )
+    cmd_parser.add_argument(
+        "-o", "--output-dir", required=True, type=str, help="output directory"
+    )
+    cmd_parser.add_argument(
+        "-r",
+        "--remote",
+        help="connect via reverse ssh tunnels on a remote server",
+        action="store_true",
+        default=False,
+    )
+    cmd_parser.add_argument(
+        "--hours",
+        default=24,
+        type=float,
+        help="time window to be summarized, ending now. Default: 24",
+    )
+    cmd_parser.add_argument(
+        "--block",
+        default=600,
+        type=int,
+        help="block length of the acceleration statistics in seconds. Default: 600",
+    )
+    cmd_parser.add_argument(
+        "--gps-interval",
+        default=60,
+        type=float,
+        help="minimum interval between gps fixes in seconds. Default: 60",
+    )
+    cmd_parser.add_argument("--verbose", action="store_true")
+    args = cmd_parser.parse_args().__dict__
+    assert os.path.isdir(args["output_dir"]), f'not a directory: {args["output_dir"]}'
+    assert args["msb"], "please provide at least one motion sensor box serial number via the --msb command line parameter"
+    return args
+
+
+def assemble_agent_cmd(begin : float, end : float, block : int, gps_interval : float) -> str:
+    """
+    the agent is sent along with the command, base64 encoded, so it does
+    not have to be installed on the boxes and is always up to date
+    """
+    with open(msb_agent.__file__, "rb") as agent_fhandle:
+        agent = base64.b64encode(agent_fhandle.read()).decode("ascii")
+    return (
+        f'"echo {agent} | base64 -d | python3 - --data-dir {MSB_REMOTE_DATA_DIR}'
+        f' --begin {begin} --end {end} --block {block} --gps-interval {gps_interval}"'
+    )
+
+
+def summarize_box(serialnumber : str, config : dict, begin : float, end : float) -> dict:
+    """
+    summarize_box(serialnumber : str, config : dict, begin : float, end : float) -> dict
+
+    runs the agent on a single box over ssh_exec and returns its summary,
+    or None if the box is not reachable or the agent failed
+    """
+    for serialnumber, ssh_access_string in assemble_hosts(
+        [serialnumber], remote=config["remote"], verbose=config["verbose"]
+    ):
+        if output := ssh_exec(
+            ssh_access_string,
+            assemble_agent_cmd(begin, end, config["block"], config["gps_interval"]),
+            verbose=config["verbose"],
+        ):
+            return json.loads(output)
+    return None
+
+
+def write_summary(summary : dict, serialnumber : str, output_dir : str, now_string : str):
+    """
+    writes the block statistics and the gps track of a box as csv files,
+    named and formatted like the ones of the 24h report
+    """
+    msb_name = serialnumber.upper()
+    msb_output_dir = os.path.join(output_dir, msb_name)
+    os.makedirs(msb_output_dir, exist_ok=True)
+    with open(os.path.join(msb_output_dir, f"{msb_name}_acc-max-block_{now_string}.csv"), "w") as output_fhandle:
+        output_fhandle.write(BLOCK_COLUMNS)
+        for block in summary["blocks"]:
+            output_fhandle.write(",".join("" if value is None else str(value) for value in block) + "\n")
+    with open(os.path.join(msb_output_dir, f"{msb_name}_gps_{now_string}.csv"), "w") as output_fhandle:
+        output_fhandle.write(GPS_COLUMNS)
+        for fix in summary["gps"]:
+            output_fhandle.write(",".join("" if value is None else str(value) for value in fix) + "\n")
+
+
+def summarize_msbdata(config : dict) -> list:
+    """
+    summarize_msbdata(config : dict) -> list
+
+    summarizes the last config['hours'] of data on all requested boxes
+    concurrently and writes the results to config['output_dir']
+
+        Returns:
+            list of the serial numbers that could not be summarized
+    """
+    now = datetime.fromtimestamp(time.time(), timezone.utc)
+    now_string = now.strftime('%Y%m%dT%H%M%S%z')
+    begin = now - timedelta(hours=config["hours"])
+    failed = list()
+    with ThreadPoolExecutor(max_workers=len(config["msb"])) as executor:
+        futures = {
+            executor.submit(summarize_box, serialnumber.lower(), config, begin.timestamp(), now.timestamp()) : serialnumber
+            for serialnumber in config["msb"]
+        }
+        for future in as_completed(futures):
+            serialnumber = futures[future]
+            try:
+                summary = future.result()
+            except Exception as e:
+                print(f"{serialnumber}: failed: {e}")
+                failed.append(serialnumber)
+                continue
+            if not summary:
+                print(f"{serialnumber}: not reachable or no summary")
+                failed.append(serialnumber)
+                continue
+            write_summary(summary, serialnumber, config["output_dir"], now_string)
+            print(f'{serialnumber}: {len(summary["blocks"])} blocks, {len(summary["gps"])} gps fixes')
+    return failed
+
+
+if __name__ == "__main__":
+    config = parse_validate_cmdline()
+    with ssh_sessions():
+        failed = summarize_msbdata(config)
+    if failed:
+        sys.exit(1)
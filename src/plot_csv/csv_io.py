@@ -1,5 +1,11 @@
+from os import path
 import pandas as pd
 import numpy as np
+import sys
+
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), '../msbdata')))
+
+from msbformats import read_data_file
 
 def gen_input_files(args : dict) -> iter:
     """
@@ -42,14 +48,17 @@ def read_csv_files(input_files : iter, verbose : bool = False) -> pd.DataFrame:
     tmp_dfs = list()
     for f in input_files:
         if verbose: print(f'parsing {f}')
-        tmp_df = pd.read_csv(f)
+        tmp_df = read_data_file(f)
         tmp_df['epoch'] = pd.to_datetime(tmp_df['epoch'], unit='s', utc=True)
         tmp_df.set_index('epoch', inplace=True)
         tmp_dfs.append(tmp_df)
     
     data = pd.concat(tmp_dfs)
-    data.sort_index(inplace=True)
-    data = data[~data.index.duplicated(keep='last')]
+    # aggregates written with aggregate_msbdata --merge are sorted and unique
+    # already, checking that is linear while sorting is not
+    if not (data.index.is_monotonic_increasing and data.index.is_unique):
+        data.sort_index(inplace=True)
+        data = data[~data.index.duplicated(keep='last')]
 
     # optional: check for NaNs
     return data